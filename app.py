@@ -1,167 +1,278 @@
+import hmac
+import json
 import logging
-from flask import Flask, render_template, request, jsonify, send_file, abort
-from werkzeug.utils import secure_filename
-import os
-import requests
-from models.pydantic_models import VideoGenerationRequest, FinalVideoResponse
-from utils.openai_helper import generate_enhanced_prompt, generate_sound_effect_description
-from utils.lumma_helper_url import generate_video
-from utils.elevenlabs_helper import generate_sound_effect
-from utils.video_processor import combine_video_and_audio
-from utils.image_to_url_helper import upload_image
-from utils.first_last_helper import upload_first_last_frames
+import time
+from flask import Flask, Response, render_template, request, jsonify, abort
+from pydantic import ValidationError
+from models.pydantic_models import PipelineRequest, BatchRequest
+from utils.openai_helper import plan_cache
+from utils.image_to_url_helper import upload_cache
+from utils.elevenlabs_helper import sound_cache
+from utils.pipeline import run_pipeline, describe_error, submit_pipeline_job, job_recovery
+from utils.job_queue import job_queue, QueueFullError
+from utils.job_store import job_store
+from utils.batch_runner import batch_runner
+from utils.download_helper import send_local_file, send_media_file, stream_remote_file
+from utils.media_store import media_store
+from utils.rate_limiter import limiters
+from utils.luma_callbacks import callback_hub
+from utils.luma_client import generation_poller
+from utils.mux_engine import mux_engine
+from utils.metrics import registry
+from utils.health import health_monitor
 from config import Config
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+CACHES = {"generation_plans": plan_cache, "image_uploads": upload_cache, "sound_effects": sound_cache}
+
+def cache_lookups():
+    values = {}
+    for name, cache in CACHES.items():
+        stats = cache.stats()
+        for result in ("memory_hits", "disk_hits", "misses"):
+            values[(name, result)] = stats[result]
+    return values
+
+# Queue depths and totals kept by other components, read when /metrics is scraped
+registry.gauge("video_job_queue_pending", "Jobs queued or running", job_queue.pending_count)
+registry.gauge("ffmpeg_queue_depth", "ffmpeg runs queued or in progress", mux_engine.queue_depth)
+registry.gauge("provider_in_flight", "Provider calls currently holding a rate-limit slot", lambda: {name: limiter.stats()["in_flight"] for name, limiter in limiters.items()}, ("provider",))
+registry.gauge("provider_throttled_total", "429 responses that paused a provider", lambda: {name: limiter.stats()["throttled"] for name, limiter in limiters.items()}, ("provider",), metric_type="counter")
+registry.gauge("cache_lookups_total", "Cache lookups, by result", cache_lookups, ("cache", "result"), metric_type="counter")
+registry.gauge("media_store_bytes", "Bytes of generated media kept on disk", media_store.total_bytes)
+registry.gauge("luma_generations_watched", "Luma generations tracked by the shared status poller", generation_poller.outstanding)
+
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def test_api_connections():
-    # Test OpenAI API
-    try:
-        generate_enhanced_prompt("Test prompt")
-        logging.info("OpenAI API connection successful")
-    except Exception as e:
-        logging.error(f"OpenAI API connection failed: {str(e)}")
-
-    # Test Lumma API
-    try:
-        headers = {"Authorization": f"Bearer {Config.LUMMA_API_KEY}"}
-        response = requests.get("https://api.lumalabs.ai/dream-machine/v1/generations", headers=headers)
-        response.raise_for_status()
-        logging.info("Lumma API connection successful")
-    except Exception as e:
-        logging.error(f"Lumma API connection failed: {str(e)}")
-
-    # Test ElevenLabs API
-    try:
-        from elevenlabs.client import ElevenLabs
-        client = ElevenLabs(api_key=Config.ELEVENLABS_API_KEY)
-        client.text_to_sound_effects.convert(text="Test", duration_seconds=1)
-        logging.info("ElevenLabs API connection successful")
-    except Exception as e:
-        logging.error(f"ElevenLabs API connection failed: {str(e)}")
+@app.before_request
+def start_background_tasks():
+    # Both are no-ops once started, so servers without a startup hook still get them
+    health_monitor.start()
+    job_recovery.start()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def parse_pipeline_form(form, files):
+    input_type = form.get('input_type')
+    prompt = form.get('prompt')
+    sound_effect_enabled = form.get('sound_effect_enabled') == 'true'
+    segments = form.get('segments', default=1, type=int)
+    if not 1 <= segments <= Config.MAX_VIDEO_SEGMENTS:
+        return None, ({"error": f"segments must be between 1 and {Config.MAX_VIDEO_SEGMENTS}"}, 400)
+
+    pipeline_request = PipelineRequest(input_type=input_type, prompt=prompt, sound_effect_enabled=sound_effect_enabled, segments=segments)
+
+    if input_type == 'image_text':
+        if 'initial_image' not in files:
+            return None, ({"error": "No initial image provided"}, 400)
+        initial_image = files['initial_image']
+        if initial_image and allowed_file(initial_image.filename):
+            pipeline_request.initial_image_bytes = initial_image.read()
+        else:
+            return None, ({"error": "Invalid initial image file"}, 400)
+    elif input_type == 'url':
+        pipeline_request.initial_image_url = form.get('url')
+        if not pipeline_request.initial_image_url:
+            return None, ({"error": "No URL provided"}, 400)
+    elif input_type == 'first_last_frame':
+        if 'first_frame' not in files or 'last_frame' not in files:
+            return None, ({"error": "Both first and last frame images are required"}, 400)
+        first_frame = files['first_frame']
+        last_frame = files['last_frame']
+        if first_frame and last_frame and allowed_file(first_frame.filename) and allowed_file(last_frame.filename):
+            pipeline_request.first_frame_bytes = first_frame.read()
+            pipeline_request.last_frame_bytes = last_frame.read()
+        else:
+            return None, ({"error": "Invalid first or last frame image file"}, 400)
+
+    return pipeline_request, None
+
+def build_pipeline_request():
+    return parse_pipeline_form(request.form, request.files)
+
 @app.route('/generate_video', methods=['POST'])
 def generate_video_route():
     try:
-        input_type = request.form.get('input_type')
-        prompt = request.form.get('prompt')
-        sound_effect_enabled = request.form.get('sound_effect_enabled') == 'true'
-        
-        initial_image_url = None
-        first_frame_url = None
-        last_frame_url = None
-        
-        if input_type == 'image_text':
-            if 'initial_image' not in request.files:
-                return jsonify({"error": "No initial image provided"}), 400
-            initial_image = request.files['initial_image']
-            if initial_image and allowed_file(initial_image.filename):
-                initial_image_filename = secure_filename(initial_image.filename)
-                initial_image_path = os.path.join(app.config['UPLOAD_FOLDER'], initial_image_filename)
-                initial_image.save(initial_image_path)
-                initial_image_url = upload_image(Config.IMAGEDB_API_KEY, image_path=initial_image_path)
-                logging.info(f"ImageDB returned URL: {initial_image_url}")
-            else:
-                return jsonify({"error": "Invalid initial image file"}), 400
-        elif input_type == 'url':
-            initial_image_url = request.form.get('url')
-            if not initial_image_url:
-                return jsonify({"error": "No URL provided"}), 400
-        elif input_type == 'first_last_frame':
-            if 'first_frame' not in request.files or 'last_frame' not in request.files:
-                return jsonify({"error": "Both first and last frame images are required"}), 400
-            first_frame = request.files['first_frame']
-            last_frame = request.files['last_frame']
-            if first_frame and last_frame and allowed_file(first_frame.filename) and allowed_file(last_frame.filename):
-                first_frame_filename = secure_filename(first_frame.filename)
-                last_frame_filename = secure_filename(last_frame.filename)
-                first_frame_path = os.path.join(app.config['UPLOAD_FOLDER'], first_frame_filename)
-                last_frame_path = os.path.join(app.config['UPLOAD_FOLDER'], last_frame_filename)
-                first_frame.save(first_frame_path)
-                last_frame.save(last_frame_path)
-                first_frame_url, last_frame_url = upload_first_last_frames(first_frame_path, last_frame_path)
-                logging.info(f"First frame URL: {first_frame_url}, Last frame URL: {last_frame_url}")
-            else:
-                return jsonify({"error": "Invalid first or last frame image file"}), 400
-        
-        # Generate enhanced prompt using OpenAI
-        enhanced_prompt = generate_enhanced_prompt(prompt)
-        logging.info("Step 1: Generated enhanced prompt using OpenAI")
-        
-        # Generate video using Lumma API
-        logging.info("Step 2: Generating video")
-        video_response = generate_video(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url)
-        logging.info("Step 3: Video generation completed")
-        
-        if sound_effect_enabled:
-            # Generate sound effect description using OpenAI
-            logging.info("Step 4: Generating sound effect description using OpenAI")
-            sound_effect_description = generate_sound_effect_description(enhanced_prompt.prompt)
-            
-            # Generate sound effect using ElevenLabs API
-            logging.info("Step 5: Generating sound effect using ElevenLabs API")
-            sound_effect_response = generate_sound_effect(sound_effect_description.description)
-            
-            if sound_effect_response.audio_url is None:
-                logging.warning("Sound effect generation failed. Returning video without audio.")
-                return jsonify({"combined_video_url": video_response.video_url, "separate_audio_url": None})
-            
-            # Combine video and audio
-            logging.info("Step 6: Mixing video and sound effect")
-            final_video = combine_video_and_audio(video_response, sound_effect_response)
-            
-            return jsonify({
-                "combined_video_url": final_video.video_url,
-                "separate_audio_url": final_video.audio_url
-            })
-        else:
-            # If sound effect is disabled, return only the video URL
-            return jsonify({
-                "combined_video_url": video_response.video_url,
-                "separate_audio_url": None
-            })
-    
+        pipeline_request, error = build_pipeline_request()
+        if error:
+            return jsonify(error[0]), error[1]
+        return jsonify(run_pipeline(pipeline_request))
     except Exception as e:
         logging.error(f"Error in generate_video_route: {str(e)}")
-        error_message = "An unexpected error occurred during video generation."
-        if "Prompt processing failed" in str(e):
-            error_message = "The video prompt was too complex. Please try a simpler description."
-        elif "API key" in str(e):
-            error_message = "There was an issue with the API authentication. Please try again later."
-        elif "Invalid cross-device link" in str(e):
-            error_message = "An error occurred while processing the video. Please try again."
-        elif "audio_url" in str(e):
-            error_message = "An error occurred while generating or processing the audio. Please try again."
-        return jsonify({"error": error_message}), 500
+        return jsonify({"error": describe_error(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        pipeline_request, error = build_pipeline_request()
+        if error:
+            return jsonify(error[0]), error[1]
+        job = submit_pipeline_job(pipeline_request)
+        return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+    except QueueFullError as e:
+        logging.warning(f"Rejecting job: {str(e)}")
+        return jsonify({"error": "The server is busy. Please try again shortly."}), 503
+    except Exception as e:
+        logging.error(f"Error in submit_job: {str(e)}")
+        return jsonify({"error": describe_error(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is not None:
+        return jsonify(job.to_dict())
+    # Jobs from before a restart, or pruned from memory, are still in the job store
+    stored = job_store.get(job_id)
+    if stored is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(stored)
+
+def stored_job_events(job_id):
+    # Only the outcome is stored, so the client gets the final event once the job finishes
+    yield "retry: 3000\n\n"
+    while True:
+        stored = job_store.get(job_id)
+        if stored is None:
+            return
+        if stored["finished_at"] is not None:
+            data = {"result": stored["result"], "error": stored["error"]}
+            yield f"event: {stored['status']}\ndata: {json.dumps(data)}\n\n"
+            return
+        yield ": keep-alive\n\n"
+        time.sleep(Config.JOB_EVENTS_STORE_POLL_SECONDS)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        # Not in this process's memory (pruned, restarted, or another worker): follow the job store
+        if job_store.get(job_id) is None:
+            return jsonify({"error": "Job not found"}), 404
+        return Response(stored_job_events(job_id), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # EventSource sends Last-Event-ID when it reconnects, so resume after it
+    last_id = request.headers.get('Last-Event-ID', type=int) or 0
+
+    def stream():
+        nonlocal last_id
+        yield "retry: 3000\n\n"
+        while True:
+            events = job.events_after(last_id, timeout=15)
+            if not events and job.finished_at is not None:
+                # The client already has the final event
+                return
+            if not events:
+                # Comment line keeps proxies from timing out an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                last_id = event["id"]
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["event"] in ("completed", "failed"):
+                    return
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/luma/callback', methods=['POST'])
+def luma_callback():
+    token = request.args.get('token', '')
+    if not Config.LUMA_CALLBACK_SECRET or not hmac.compare_digest(token, Config.LUMA_CALLBACK_SECRET):
+        abort(403)
+    payload = request.get_json(silent=True)
+    if not payload or 'id' not in payload or 'state' not in payload:
+        return jsonify({"error": "Invalid callback payload"}), 400
+    callback_hub.deliver(payload)
+    return jsonify({"received": True})
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    try:
+        batch_request = BatchRequest.model_validate(request.get_json(silent=True) or {})
+    except ValidationError as e:
+        return jsonify({"error": "Invalid batch request", "details": json.loads(e.json())}), 400
+
+    if len(batch_request.items) > Config.BATCH_MAX_ITEMS:
+        return jsonify({"error": f"A batch can contain at most {Config.BATCH_MAX_ITEMS} items"}), 400
+
+    pipeline_requests = []
+    for index, item in enumerate(batch_request.items):
+        if item.input_type not in ('text', 'url', 'first_last_frame'):
+            return jsonify({"error": f"Item {index}: input_type must be text, url or first_last_frame"}), 400
+        if item.input_type == 'url' and not item.url:
+            return jsonify({"error": f"Item {index}: No URL provided"}), 400
+        if item.input_type == 'first_last_frame' and not (item.first_frame_url and item.last_frame_url):
+            return jsonify({"error": f"Item {index}: Both first and last frame URLs are required"}), 400
+        if item.segments > Config.MAX_VIDEO_SEGMENTS:
+            return jsonify({"error": f"Item {index}: segments must be at most {Config.MAX_VIDEO_SEGMENTS}"}), 400
+        pipeline_requests.append(item.to_pipeline_request())
+
+    parallelism = min(batch_request.parallelism or Config.BATCH_DEFAULT_PARALLELISM, Config.BATCH_MAX_PARALLELISM)
+    batch = batch_runner.submit(pipeline_requests, parallelism)
+    return jsonify({
+        "batch_id": batch.id,
+        "parallelism": parallelism,
+        "status_url": f"/batches/{batch.id}",
+        "stream_url": f"/batches/{batch.id}/stream",
+    }), 202
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch_runner.describe(batch))
+
+@app.route('/batches/<batch_id>/stream', methods=['GET'])
+def stream_batch(batch_id):
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    # Newline-delimited JSON: one line per finished item, then a summary line
+    lines = (json.dumps(event) + "\n" for event in batch_runner.stream(batch))
+    return Response(lines, mimetype='application/x-ndjson')
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({name: cache.stats() for name, cache in CACHES.items()})
+
+@app.route('/rate_limits', methods=['GET'])
+def rate_limits():
+    return jsonify({name: limiter.stats() for name, limiter in limiters.items()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Serves the last background probe results; never calls a provider itself
+    return jsonify(health_monitor.snapshot())
+
+@app.route('/media/<path:media_id>', methods=['GET'])
+def media(media_id):
+    # Inline playback of stored outputs and their HLS, poster and preview renditions
+    file_path = media_store.resolve(media_id)
+    if not file_path:
+        abort(404, description="Media not found.")
+    return send_media_file(file_path)
 
 @app.route('/download_combined/<path:filename>', methods=['GET'])
 def download_combined(filename):
     try:
-        file_path = os.path.join(os.getcwd(), filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+        file_path = media_store.resolve(filename)
+        if file_path:
+            return send_local_file(file_path)
         else:
-            # If the file doesn't exist locally, it might be a remote URL
-            response = requests.get(filename, stream=True)
-            response.raise_for_status()
-            return response.content, 200, {
-                'Content-Type': response.headers['Content-Type'],
-                'Content-Disposition': f'attachment; filename={os.path.basename(filename)}'
-            }
+            # If the file isn't in the media store, it might be a remote URL
+            return stream_remote_file(filename)
     except Exception as e:
         logging.error(f"Error in download_combined: {str(e)}")
         abort(404, description="File not found or unable to download.")
@@ -169,23 +280,17 @@ def download_combined(filename):
 @app.route('/download_audio/<path:filename>', methods=['GET'])
 def download_audio(filename):
     try:
-        file_path = os.path.join(os.getcwd(), filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+        file_path = media_store.resolve(filename)
+        if file_path:
+            return send_local_file(file_path, content_type='audio/mpeg')
         else:
-            # If the file doesn't exist locally, it might be a remote URL
-            response = requests.get(filename, stream=True)
-            response.raise_for_status()
-            return response.content, 200, {
-                'Content-Type': 'audio/mpeg',
-                'Content-Disposition': f'attachment; filename={os.path.basename(filename)}'
-            }
+            # If the file isn't in the media store, it might be a remote URL
+            return stream_remote_file(filename, content_type='audio/mpeg')
     except Exception as e:
         logging.error(f"Error in download_audio: {str(e)}")
         abort(404, description="File not found or unable to download.")
 
 if __name__ == '__main__':
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-    test_api_connections()
+    health_monitor.start()
+    job_recovery.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,100 @@
+# ASGI entry point, e.g. `uvicorn asgi:app --port 5000`.
+# POST /generate_video runs on the asyncio pipeline, so a single process can hold hundreds of
+# generations that are mostly waiting on Luma. Every other route is served by the Flask app.
+import io
+import json
+import logging
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+from app import app as flask_app, parse_pipeline_form
+from utils.async_pipeline import run_pipeline_async
+from utils.pipeline import describe_error, job_recovery
+from utils import http_client
+from utils.metrics import registry
+from utils.health import health_monitor
+from config import Config
+
+flask_asgi = WsgiToAsgi(flask_app)
+active_pipelines = 0
+
+registry.gauge("video_async_pipelines_active", "Generations running on the asyncio pipeline", lambda: active_pipelines)
+
+async def send_json(send, status: int, payload: dict):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def read_body(receive, limit: int):
+    # Returns None once the body grows past the limit
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.extend(message.get("body", b""))
+        if len(body) > limit:
+            return None
+        if not message.get("more_body"):
+            return bytes(body)
+
+async def generate_video(scope, receive, send):
+    global active_pipelines
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+    limit = flask_app.config['MAX_CONTENT_LENGTH']
+    body = await read_body(receive, limit)
+    if body is None:
+        await send_json(send, 413, {"error": "Request is too large"})
+        return
+
+    try:
+        mimetype, options = parse_options_header(headers.get("content-type", ""))
+        _, form, files = FormDataParser(max_content_length=limit).parse(io.BytesIO(body), mimetype, len(body), options)
+        pipeline_request, error = parse_pipeline_form(form, files)
+    except Exception as e:
+        logging.error(f"Invalid generate_video request: {str(e)}")
+        await send_json(send, 400, {"error": "Invalid request"})
+        return
+    if error:
+        await send_json(send, error[1], error[0])
+        return
+
+    if active_pipelines >= Config.ASYNC_MAX_PIPELINES:
+        logging.warning(f"Rejecting request: {active_pipelines} pipelines already running")
+        await send_json(send, 503, {"error": "The server is busy. Please try again shortly."})
+        return
+
+    active_pipelines += 1
+    try:
+        result = await run_pipeline_async(pipeline_request)
+    except Exception as e:
+        logging.error(f"Error in async generate_video: {str(e)}")
+        await send_json(send, 500, {"error": describe_error(e)})
+        return
+    finally:
+        active_pipelines -= 1
+    await send_json(send, 200, result)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            health_monitor.start()
+            job_recovery.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await http_client.close_async_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/generate_video" and scope["method"] == "POST":
+        await generate_video(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
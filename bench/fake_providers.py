@@ -0,0 +1,358 @@
+# Local stand-ins for the provider APIs (OpenAI chat completions, Luma generations, ElevenLabs
+# sound effects and imgbb uploads), for exercising the app without paying for real calls.
+#
+#   python -m bench.fake_providers --port 8100 --luma-seconds 20 --luma-failure-rate 0.05
+#
+# then start the app with the environment printed at startup (see provider_env), e.g.
+#
+#   LUMA_API_BASE=http://127.0.0.1:8100/dream-machine/v1 OPENAI_BASE_URL=http://127.0.0.1:8100/v1 \
+#   ELEVENLABS_BASE_URL=http://127.0.0.1:8100 IMGBB_UPLOAD_URL=http://127.0.0.1:8100/1/upload python app.py
+#
+# Every provider has a response latency, a failure rate (HTTP 500) and a throttle rate (HTTP 429 with
+# Retry-After). Luma generations additionally move queued -> dreaming -> completed/failed on a timer
+# drawn from a completion-time distribution and, when the request carries a callback_url, every
+# transition is POSTed there like the real API does.
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import requests
+
+LUMA_PREFIX = "/dream-machine/v1/generations"
+OPENAI_CHAT_PATH = "/v1/chat/completions"
+ELEVENLABS_SOUND_PATH = "/v1/sound-generation"
+IMGBB_UPLOAD_PATH = "/1/upload"
+MODELS_PATH = "/v1/models"
+
+DISTRIBUTIONS = ("fixed", "normal", "lognormal", "exponential")
+
+def sample_duration(mean: float, stddev: float, distribution: str) -> float:
+    if mean <= 0:
+        return 0.0
+    if distribution == "fixed" or stddev <= 0:
+        return mean
+    if distribution == "normal":
+        return max(0.0, random.gauss(mean, stddev))
+    if distribution == "lognormal":
+        # Long right tail, like real generation queues; parameters chosen so mean and stddev match
+        sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+        return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    if distribution == "exponential":
+        return random.expovariate(1 / mean)
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+class ProviderProfile:
+    def __init__(self, name: str, latency: float, stddev: float, distribution: str, failure_rate: float, throttle_rate: float):
+        self.name = name
+        self.latency = latency
+        self.stddev = stddev
+        self.distribution = distribution
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.stats = {"requests": 0, "failed": 0, "throttled": 0, "bytes_in": 0, "bytes_out": 0}
+        self.lock = threading.Lock()
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def simulate(self):
+        # Sleeps for the sampled latency and returns an error status to send instead of the response, if any
+        self.count("requests")
+        time.sleep(sample_duration(self.latency, self.stddev, self.distribution))
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.count("throttled")
+            return 429
+        if roll < self.throttle_rate + self.failure_rate:
+            self.count("failed")
+            return 500
+        return None
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+class FakeLuma:
+    def __init__(self, base_url: str, completion_seconds: float, completion_stddev: float, distribution: str, failure_rate: float):
+        self.base_url = base_url
+        self.completion_seconds = completion_seconds
+        self.completion_stddev = completion_stddev
+        self.distribution = distribution
+        self.failure_rate = failure_rate
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.stats = {"created": 0, "completed": 0, "failed": 0, "status_requests": 0, "list_requests": 0, "callbacks_sent": 0}
+
+    def create(self, body: dict) -> dict:
+        generation = {
+            "id": str(uuid.uuid4()),
+            "state": "queued",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "assets": None,
+            "failure_reason": None,
+            "request": body,
+        }
+        with self.lock:
+            self.generations[generation["id"]] = generation
+            self.stats["created"] += 1
+        threading.Thread(target=self._advance, args=(generation["id"], body.get("callback_url")), daemon=True).start()
+        return dict(generation)
+
+    def get(self, generation_id: str):
+        with self.lock:
+            self.stats["status_requests"] += 1
+            generation = self.generations.get(generation_id)
+            return dict(generation) if generation else None
+
+    def list(self, limit: int, offset: int) -> dict:
+        with self.lock:
+            self.stats["list_requests"] += 1
+            newest_first = list(reversed(list(self.generations.values())))
+            page = [dict(generation) for generation in newest_first[offset:offset + limit]]
+            return {"generations": page, "has_more": offset + limit < len(newest_first), "count": len(page)}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def _advance(self, generation_id: str, callback: str):
+        duration = max(1.0, sample_duration(self.completion_seconds, self.completion_stddev, self.distribution))
+        queued_for = min(1.0, duration / 4)
+        time.sleep(queued_for)
+        self._transition(generation_id, callback, state="dreaming")
+        time.sleep(duration - queued_for)
+        if random.random() < self.failure_rate:
+            self._transition(generation_id, callback, state="failed", failure_reason="Simulated failure")
+        else:
+            self._transition(generation_id, callback, state="completed", assets={"video": f"{self.base_url}/videos/{generation_id}.mp4"})
+
+    def _transition(self, generation_id: str, callback: str, **changes):
+        with self.lock:
+            generation = self.generations[generation_id]
+            generation.update(changes)
+            payload = dict(generation)
+            if changes["state"] in ("completed", "failed"):
+                self.stats[changes["state"]] += 1
+        if callback:
+            try:
+                requests.post(callback, json=payload, timeout=5)
+                with self.lock:
+                    self.stats["callbacks_sent"] += 1
+            except requests.RequestException as e:
+                logging.warning(f"Callback to {callback} failed: {str(e)}")
+
+def chat_completion(body: dict) -> dict:
+    messages = body.get("messages") or []
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    if "json" in system.lower() or (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps({"prompt": f"Cinematic shot: {user[-200:]}", "aspect_ratio": "16:9", "duration": 5,
+                              "sound_description": f"Soft ambient whoosh with distant birds for: {user[-80:]}"})
+    else:
+        content = f"Soft ambient whoosh with distant birds for: {user[-80:]}"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(system.split()) + len(user.split()), "completion_tokens": len(content.split()), "total_tokens": 0},
+    }
+
+def build_media(video_seconds: int) -> tuple:
+    # Real files so ffmpeg muxing does real work; placeholders if ffmpeg is not installed
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        logging.warning("ffmpeg not found; serving placeholder media, so muxing will fail")
+        return b"\x00" * 1024, b"\x00" * 1024
+    workdir = tempfile.mkdtemp(prefix="fake-providers-")
+    video_path = os.path.join(workdir, "video.mp4")
+    audio_path = os.path.join(workdir, "audio.mp3")
+    subprocess.run([ffmpeg, "-nostdin", "-y", "-f", "lavfi", "-i", f"testsrc=duration={video_seconds}:size=640x360:rate=24",
+                    "-pix_fmt", "yuv420p", "-movflags", "+faststart", video_path], capture_output=True, check=True)
+    subprocess.run([ffmpeg, "-nostdin", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={video_seconds}", audio_path],
+                   capture_output=True, check=True)
+    with open(video_path, "rb") as f:
+        video_bytes = f.read()
+    with open(audio_path, "rb") as f:
+        audio_bytes = f.read()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return video_bytes, audio_bytes
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    luma = None
+    profiles = {}
+    video_bytes = b""
+    audio_bytes = b""
+    image_bytes = b""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _simulate(self, provider: str, body: bytes) -> bool:
+        # Returns False when an error response was sent instead of the real one
+        profile = self.profiles[provider]
+        profile.count("bytes_in", len(body))
+        status = profile.simulate()
+        if status == 429:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": "1"})
+            return False
+        if status:
+            self._send_json(status, {"error": {"message": "Simulated provider failure"}})
+            return False
+        return True
+
+    def _reply(self, provider: str, status: int, body: bytes, content_type: str):
+        self.profiles[provider].count("bytes_out", len(body))
+        self._send(status, body, content_type)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        if path == LUMA_PREFIX:
+            if self._simulate("luma", body):
+                self._reply("luma", 201, json.dumps(self.luma.create(json.loads(body or b"{}"))).encode(), "application/json")
+        elif path == OPENAI_CHAT_PATH:
+            if self._simulate("openai", body):
+                self._reply("openai", 200, json.dumps(chat_completion(json.loads(body or b"{}"))).encode(), "application/json")
+        elif path == ELEVENLABS_SOUND_PATH:
+            if self._simulate("elevenlabs", body):
+                self._reply("elevenlabs", 200, self.audio_bytes, "audio/mpeg")
+        elif path == IMGBB_UPLOAD_PATH:
+            if self._simulate("imgbb", body):
+                image_url = f"http://{self.headers.get('Host')}/images/{uuid.uuid4().hex}.jpg"
+                payload = {"success": True, "status": 200, "data": {"url": image_url, "display_url": image_url}}
+                self._reply("imgbb", 200, json.dumps(payload).encode(), "application/json")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if path == LUMA_PREFIX:
+            if self._simulate("luma", b""):
+                query = parse_qs(parsed.query)
+                limit = int(query.get("limit", ["10"])[0])
+                offset = int(query.get("offset", ["0"])[0])
+                self._reply("luma", 200, json.dumps(self.luma.list(limit, offset)).encode(), "application/json")
+        elif path.startswith(LUMA_PREFIX + "/"):
+            if self._simulate("luma", b""):
+                generation = self.luma.get(path[len(LUMA_PREFIX) + 1:])
+                payload = generation or {"detail": "Generation not found"}
+                self._reply("luma", 200 if generation else 404, json.dumps(payload).encode(), "application/json")
+        elif path == MODELS_PATH:
+            # Health probes of both OpenAI and ElevenLabs land here
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        elif path.startswith("/videos/"):
+            self._send(200, self.video_bytes, "video/mp4")
+        elif path.startswith("/images/"):
+            self._send(200, self.image_bytes, "image/jpeg")
+        elif path == "/stats":
+            stats = {name: profile.snapshot() for name, profile in self.profiles.items()}
+            stats["luma_generations"] = self.luma.snapshot()
+            self._send_json(200, stats)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    # Stay quiet when a client hangs up mid-response under load
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def provider_env(base_url: str) -> dict:
+    # Environment that points the app at these fakes
+    return {
+        "LUMA_API_BASE": f"{base_url}/dream-machine/v1",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "ELEVENLABS_BASE_URL": base_url,
+        "IMGBB_UPLOAD_URL": f"{base_url}{IMGBB_UPLOAD_PATH}",
+        "OPENAI_API_KEY": "fake",
+        "LUMMA_API_KEY": "fake",
+        "ELEVENLABS_API_KEY": "fake",
+        "IMAGEDB_API_KEY": "fake",
+    }
+
+def build_server(host: str, port: int, args) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), FakeProviderHandler)
+    server.daemon_threads = True
+    base_url = f"http://{host}:{server.server_port}"
+    FakeProviderHandler.luma = FakeLuma(base_url, args.luma_seconds, args.luma_stddev, args.luma_distribution, args.luma_failure_rate)
+    FakeProviderHandler.profiles = {
+        name: ProviderProfile(
+            name,
+            getattr(args, f"{name}_latency"),
+            getattr(args, f"{name}_latency_stddev"),
+            args.latency_distribution,
+            getattr(args, f"{name}_error_rate"),
+            getattr(args, f"{name}_throttle_rate"),
+        )
+        for name in ("openai", "luma", "elevenlabs", "imgbb")
+    }
+    video_bytes, audio_bytes = build_media(args.media_seconds)
+    if args.video:
+        with open(args.video, "rb") as f:
+            video_bytes = f.read()
+    FakeProviderHandler.video_bytes = video_bytes
+    FakeProviderHandler.audio_bytes = audio_bytes
+    FakeProviderHandler.image_bytes = b"\xff\xd8\xff\xd9"
+    return server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in provider APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-distribution", choices=DISTRIBUTIONS, default="lognormal", help="distribution of API response latencies")
+    for name, latency in (("openai", 0.8), ("luma", 0.3), ("elevenlabs", 2.0), ("imgbb", 0.5)):
+        parser.add_argument(f"--{name}-latency", type=float, default=latency, help=f"mean {name} response time in seconds")
+        parser.add_argument(f"--{name}-latency-stddev", type=float, default=latency / 2)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+        parser.add_argument(f"--{name}-throttle-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--luma-seconds", type=float, default=30, help="mean generation completion time")
+    parser.add_argument("--luma-stddev", type=float, default=5, help="standard deviation of generation completion time")
+    parser.add_argument("--luma-distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--luma-failure-rate", type=float, default=0.0, help="fraction of generations that end in state failed")
+    parser.add_argument("--media-seconds", type=int, default=5, help="length of the generated test video and audio")
+    parser.add_argument("--video", help="MP4 file served as every generated video instead of the test pattern")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    server = build_server(args.host, args.port, args)
+    base_url = f"http://{args.host}:{server.server_port}"
+    logging.info(f"Fake providers listening on {base_url}")
+    logging.info("Point the app at them with: " + " ".join(f"{name}={value}" for name, value in provider_env(base_url).items()))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
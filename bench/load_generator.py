@@ -0,0 +1,369 @@
+# Drives the app with concurrent generation requests and reports throughput, latency percentiles,
+# per-stage timings (from /metrics), provider call counts and server resource usage.
+#
+# Against fakes it starts itself (no API keys or spend):
+#
+#   python -m bench.load_generator --spawn --mode jobs --requests 50 --concurrency 10 \
+#       --provider-args "--luma-seconds 8 --luma-failure-rate 0.05"
+#
+# Against an app that is already running:
+#
+#   python -m bench.load_generator --target http://127.0.0.1:5000 --server-pid 1234 --mode sync
+#
+# --json-out writes the report so runs can be compared to catch regressions.
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGE_METRIC = "video_pipeline_stage_seconds"
+
+PROMPTS = [
+    "A red fox running through fresh snow at dawn",
+    "Waves crashing on a rocky shore during a storm",
+    "A busy night market lit by paper lanterns",
+    "A hot air balloon drifting over green hills",
+    "Rain falling on a quiet city street",
+    "A hummingbird hovering next to a flower",
+    "A spaceship landing in a desert canyon",
+    "A train crossing a bridge in autumn",
+]
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class ResourceSampler:
+    # Samples CPU time and resident memory of the server process from /proc (Linux only)
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        if len(self.samples) < 2:
+            return {"available": False}
+        first, last = self.samples[0], self.samples[-1]
+        cpu_seconds = last["cpu"] - first["cpu"]
+        wall_seconds = last["time"] - first["time"]
+        return {
+            "available": True,
+            "cpu_seconds": round(cpu_seconds, 2),
+            "child_cpu_seconds": round(last["child_cpu"] - first["child_cpu"], 2),
+            "avg_cpu_percent": round(100 * cpu_seconds / wall_seconds, 1) if wall_seconds else None,
+            "peak_rss_mb": round(max(sample["rss"] for sample in self.samples) / (1024 * 1024), 1),
+            "peak_threads": max(sample["threads"] for sample in self.samples),
+        }
+
+    def _read(self) -> dict:
+        with open(f"/proc/{self.pid}/stat") as f:
+            # The command name may contain spaces, so split after its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        rss = threads = 0
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+        return {
+            "time": time.monotonic(),
+            "cpu": (int(fields[11]) + int(fields[12])) / self._clock_ticks,
+            "child_cpu": (int(fields[13]) + int(fields[14])) / self._clock_ticks,
+            "rss": rss,
+            "threads": threads,
+        }
+
+    def _run(self):
+        stopped = False
+        while True:
+            try:
+                self.samples.append(self._read())
+            except (OSError, ValueError, IndexError):
+                return
+            if stopped:
+                return
+            stopped = self._stop.wait(self.interval)
+
+def stage_totals(target: str) -> dict:
+    # Per-stage (sum, count) from the app's /metrics, to attribute latency to stages
+    try:
+        text = requests.get(f"{target}/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    totals = {}
+    for line in text.splitlines():
+        for suffix, position in (("_sum", 0), ("_count", 1)):
+            prefix = f'{STAGE_METRIC}{suffix}{{stage="'
+            if line.startswith(prefix):
+                stage = line[len(prefix):].split('"', 1)[0]
+                totals.setdefault(stage, [0.0, 0])[position] = float(line.rsplit(" ", 1)[1])
+    return totals
+
+def provider_stats(providers: str) -> dict:
+    if not providers:
+        return {}
+    try:
+        return requests.get(f"{providers}/stats", timeout=10).json()
+    except (requests.RequestException, ValueError):
+        return {}
+
+def diff_stats(before: dict, after: dict) -> dict:
+    return {
+        name: {key: value - before.get(name, {}).get(key, 0) for key, value in values.items()}
+        for name, values in after.items()
+    }
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.target = args.target.rstrip("/")
+        self.latencies = []
+        self.errors = Counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self) -> requests.Session:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def item(self, index: int) -> dict:
+        distinct = self.args.distinct_prompts
+        base = PROMPTS[index % len(PROMPTS)]
+        prompt = f"{base} (variant {index % distinct})" if distinct else f"{base} (request {index})"
+        item = {"prompt": prompt, "input_type": self.args.input_type, "sound_effect_enabled": self.args.sound}
+        if self.args.input_type == "url":
+            item["url"] = self.args.image_url
+        return item
+
+    def form(self, index: int) -> dict:
+        item = self.item(index)
+        form = {"prompt": item["prompt"], "input_type": item["input_type"], "sound_effect_enabled": "true" if item["sound_effect_enabled"] else "false"}
+        if "url" in item:
+            form["url"] = item["url"]
+        return form
+
+    def record(self, started: float, error: str = None):
+        with self.lock:
+            if error:
+                self.errors[error[:120]] += 1
+            else:
+                self.latencies.append(time.monotonic() - started)
+
+    def run_sync(self, index: int):
+        started = time.monotonic()
+        try:
+            response = self.session().post(f"{self.target}/generate_video", data=self.form(index), timeout=self.args.timeout)
+            body = response.json()
+            if response.status_code == 200 and body.get("combined_video_url"):
+                self.record(started)
+            else:
+                self.record(started, f"HTTP {response.status_code}: {body.get('error')}")
+        except (requests.RequestException, ValueError) as e:
+            self.record(started, type(e).__name__)
+
+    def run_job(self, index: int):
+        started = time.monotonic()
+        try:
+            response = self.session().post(f"{self.target}/jobs", data=self.form(index), timeout=30)
+            if response.status_code != 202:
+                self.record(started, f"HTTP {response.status_code}: {response.json().get('error')}")
+                return
+            status_url = f"{self.target}{response.json()['status_url']}"
+            while time.monotonic() - started < self.args.timeout:
+                time.sleep(self.args.poll_interval)
+                job = self.session().get(status_url, timeout=30).json()
+                if job["status"] == "completed":
+                    self.record(started)
+                    return
+                if job["status"] == "failed":
+                    self.record(started, f"job failed: {job.get('error')}")
+                    return
+            self.record(started, "timed out")
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self.record(started, type(e).__name__)
+
+    def run_batch(self, batch_index: int):
+        size = self.args.batch_size
+        indexes = range(batch_index * size, min(self.args.requests, (batch_index + 1) * size))
+        payload = {"items": [self.item(index) for index in indexes], "parallelism": self.args.batch_parallelism}
+        started = time.monotonic()
+        try:
+            response = self.session().post(f"{self.target}/generate_batch", json=payload, timeout=30)
+            if response.status_code != 202:
+                for _ in indexes:
+                    self.record(started, f"HTTP {response.status_code}: {response.json().get('error')}")
+                return
+            stream_url = f"{self.target}{response.json()['stream_url']}"
+            with self.session().get(stream_url, stream=True, timeout=self.args.timeout) as stream:
+                for line in stream.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "item":
+                        self.record(started, None if event["status"] == "completed" else f"item failed: {event.get('error')}")
+                    elif event["type"] == "summary":
+                        return
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self.record(started, type(e).__name__)
+
+    def run(self) -> dict:
+        args = self.args
+        if args.mode == "batch":
+            units, worker = (args.requests + args.batch_size - 1) // args.batch_size, self.run_batch
+        else:
+            units, worker = args.requests, self.run_job if args.mode == "jobs" else self.run_sync
+
+        stages_before = stage_totals(self.target)
+        providers_before = provider_stats(args.providers)
+        sampler = ResourceSampler(args.server_pid).start() if args.server_pid else None
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(worker, range(units)))
+        wall_seconds = time.monotonic() - started
+        resources = sampler.stop() if sampler else {"available": False}
+
+        stages_after = stage_totals(self.target)
+        stages = {}
+        for stage, (total, count) in stages_after.items():
+            before_total, before_count = stages_before.get(stage, (0.0, 0))
+            if count > before_count:
+                stages[stage] = {"count": int(count - before_count), "mean_seconds": round((total - before_total) / (count - before_count), 3)}
+
+        latencies = sorted(self.latencies)
+        return {
+            "mode": args.mode,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "succeeded": len(latencies),
+            "failed": sum(self.errors.values()),
+            "wall_seconds": round(wall_seconds, 2),
+            "throughput_per_minute": round(60 * len(latencies) / wall_seconds, 2) if wall_seconds else None,
+            "latency_seconds": {
+                "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else None,
+            },
+            "errors": dict(self.errors),
+            "stages": stages,
+            "providers": diff_stats(providers_before, provider_stats(args.providers)),
+            "resources": resources,
+        }
+
+def spawn(args):
+    # Fake providers in this process, the app in a child process pointed at them
+    from bench.fake_providers import build_server, parse_args as parse_provider_args, provider_env
+
+    provider_args = parse_provider_args(shlex.split(args.provider_args))
+    server = build_server("127.0.0.1", 0, provider_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    providers = f"http://127.0.0.1:{server.server_port}"
+
+    env = dict(os.environ, **provider_env(providers))
+    env["DATA_DIR"] = tempfile.mkdtemp(prefix="bench-data-")
+    env.setdefault("LUMA_POLL_DEFAULT_EXPECTED", str(provider_args.luma_seconds))
+    app = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(args.app_port), "--no-reload", "--no-debugger"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL if not args.app_logs else None, stderr=subprocess.STDOUT if not args.app_logs else None,
+    )
+    target = f"http://127.0.0.1:{args.app_port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if app.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {app.returncode}")
+        try:
+            requests.get(f"{target}/metrics", timeout=2)
+            break
+        except requests.RequestException:
+            time.sleep(0.5)
+    else:
+        app.terminate()
+        raise RuntimeError("App did not start within 60s")
+    return server, app, target, providers
+
+def print_report(report: dict):
+    latency = report["latency_seconds"]
+    print(f"\n{report['mode']}: {report['succeeded']}/{report['requests']} succeeded in {report['wall_seconds']}s "
+          f"(concurrency {report['concurrency']}, {report['throughput_per_minute']} videos/min)")
+    if latency["p50"] is not None:
+        print("latency  " + "  ".join(f"{name} {value:.2f}s" for name, value in latency.items() if value is not None))
+    for error, count in report["errors"].items():
+        print(f"error    {count} x {error}")
+    for stage, values in sorted(report["stages"].items(), key=lambda entry: -entry[1]["mean_seconds"]):
+        print(f"stage    {stage:<16} mean {values['mean_seconds']:.3f}s over {values['count']}")
+    for provider, values in report["providers"].items():
+        print(f"provider {provider:<16} " + " ".join(f"{key}={value}" for key, value in values.items()))
+    resources = report["resources"]
+    if resources.get("available"):
+        print(f"server   cpu {resources['cpu_seconds']}s (avg {resources['avg_cpu_percent']}%), ffmpeg cpu {resources['child_cpu_seconds']}s, "
+              f"peak rss {resources['peak_rss_mb']} MB, peak threads {resources['peak_threads']}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the video generation endpoints")
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="base URL of a running app")
+    parser.add_argument("--mode", choices=("sync", "jobs", "batch"), default="jobs", help="/generate_video, /jobs or /generate_batch")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5, help="concurrent clients (concurrent batches in batch mode)")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--batch-parallelism", type=int, default=5)
+    parser.add_argument("--input-type", choices=("text", "url"), default="text")
+    parser.add_argument("--image-url", default="https://example.com/image.jpg")
+    parser.add_argument("--sound", action=argparse.BooleanOptionalAction, default=True, help="request sound effects (and ffmpeg muxing)")
+    parser.add_argument("--distinct-prompts", type=int, default=0, help="cycle through this many prompts to exercise caches; 0 makes every prompt unique")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=900, help="per-request timeout in seconds")
+    parser.add_argument("--server-pid", type=int, help="pid of the app process, for CPU and memory sampling")
+    parser.add_argument("--providers", help="base URL of bench.fake_providers, for provider call counts")
+    parser.add_argument("--spawn", action="store_true", help="start fake providers and the app locally")
+    parser.add_argument("--provider-args", default="--luma-seconds 10", help="arguments for bench.fake_providers when spawning")
+    parser.add_argument("--app-port", type=int, default=5055)
+    parser.add_argument("--app-logs", action="store_true", help="show the spawned app's output")
+    parser.add_argument("--json-out", help="write the report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = app = None
+    if args.spawn:
+        server, app, args.target, args.providers = spawn(args)
+        args.server_pid = app.pid
+    try:
+        report = LoadGenerator(args).run()
+    finally:
+        if app:
+            app.terminate()
+            app.wait(timeout=30)
+        if server:
+            server.shutdown()
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -8,3 +8,135 @@ class Config:
     LUMMA_API_KEY = os.getenv('LUMMA_API_KEY')
     ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
     IMAGEDB_API_KEY = os.getenv('IMAGEDB_API_KEY')
+
+    # Background job queue for /jobs
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 8))
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 500))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 3600))
+
+    # Concurrent generations accepted by the asyncio pipeline behind asgi.py
+    ASYNC_MAX_PIPELINES = int(os.getenv('ASYNC_MAX_PIPELINES', 500))
+    # Threads for long-form requests on the ASGI app, which run the threaded pipeline end to end
+    ASYNC_LONG_FORM_WORKERS = int(os.getenv('ASYNC_LONG_FORM_WORKERS', 4))
+
+    # Threads for the sound-effect branch that runs alongside Luma generation
+    AUDIO_WORKERS = int(os.getenv('AUDIO_WORKERS', 8))
+
+    # Local state (poll history, caches, indexes) lives under this directory
+    DATA_DIR = os.getenv('DATA_DIR', '.data')
+
+    # Durable job records and per-stage results, so unfinished jobs resume after a restart
+    JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', os.path.join(DATA_DIR, 'jobs.sqlite3'))
+    JOB_STORE_RETENTION_SECONDS = float(os.getenv('JOB_STORE_RETENTION_SECONDS', 7 * 24 * 3600))
+    JOB_RECOVERY_INTERVAL_SECONDS = float(os.getenv('JOB_RECOVERY_INTERVAL_SECONDS', 60))
+    JOB_EVENTS_STORE_POLL_SECONDS = float(os.getenv('JOB_EVENTS_STORE_POLL_SECONDS', 2))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+    # Adaptive Luma status polling
+    LUMA_POLL_HISTORY_PATH = os.getenv('LUMA_POLL_HISTORY_PATH', os.path.join(DATA_DIR, 'luma_poll_history.json'))
+    LUMA_POLL_HISTORY_SAMPLES = int(os.getenv('LUMA_POLL_HISTORY_SAMPLES', 50))
+    LUMA_POLL_DEFAULT_EXPECTED = float(os.getenv('LUMA_POLL_DEFAULT_EXPECTED', 60))
+    LUMA_POLL_HOLD_FRACTION = float(os.getenv('LUMA_POLL_HOLD_FRACTION', 0.8))
+    LUMA_POLL_STALE_FACTOR = float(os.getenv('LUMA_POLL_STALE_FACTOR', 1.5))
+    LUMA_POLL_MIN_INTERVAL = float(os.getenv('LUMA_POLL_MIN_INTERVAL', 2))
+    LUMA_POLL_MAX_INTERVAL = float(os.getenv('LUMA_POLL_MAX_INTERVAL', 20))
+    LUMA_POLL_JITTER = float(os.getenv('LUMA_POLL_JITTER', 0.2))
+    LUMA_POLL_DEADLINE_SECONDS = float(os.getenv('LUMA_POLL_DEADLINE_SECONDS', 900))
+    # Shared poller: due generations are refreshed together, via the list endpoint once a few are due
+    LUMA_POLL_BATCH_WINDOW = float(os.getenv('LUMA_POLL_BATCH_WINDOW', 1))
+    LUMA_POLL_LIST_MIN_BATCH = int(os.getenv('LUMA_POLL_LIST_MIN_BATCH', 2))
+    LUMA_POLL_LIST_PAGE_SIZE = int(os.getenv('LUMA_POLL_LIST_PAGE_SIZE', 100))
+    LUMA_POLL_LIST_MAX_PAGES = int(os.getenv('LUMA_POLL_LIST_MAX_PAGES', 3))
+
+    # Shared HTTP connection pools for provider calls
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 50))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+    HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5))
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+    ELEVENLABS_TIMEOUT = float(os.getenv('ELEVENLABS_TIMEOUT', 120))
+
+    # Persistent caches (sqlite)
+    CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(DATA_DIR, 'cache.sqlite3'))
+    UPLOAD_CACHE_TTL_SECONDS = float(os.getenv('UPLOAD_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    UPLOAD_CACHE_MAX_ENTRIES = int(os.getenv('UPLOAD_CACHE_MAX_ENTRIES', 10000))
+    PROMPT_CACHE_TTL_SECONDS = float(os.getenv('PROMPT_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    PROMPT_CACHE_MAX_ENTRIES = int(os.getenv('PROMPT_CACHE_MAX_ENTRIES', 50000))
+    PROMPT_CACHE_MEMORY_ENTRIES = int(os.getenv('PROMPT_CACHE_MEMORY_ENTRIES', 1000))
+    # Sound-effect clips are kept in the media store, so MEDIA_BUDGET_BYTES bounds their size
+    SOUND_CACHE_TTL_SECONDS = float(os.getenv('SOUND_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+    SOUND_CACHE_MAX_ENTRIES = int(os.getenv('SOUND_CACHE_MAX_ENTRIES', 5000))
+
+    # Deduplication of identical Luma generations
+    GENERATION_DEDUP_TTL_SECONDS = float(os.getenv('GENERATION_DEDUP_TTL_SECONDS', 24 * 3600))
+    GENERATION_CREATE_TIMEOUT_SECONDS = float(os.getenv('GENERATION_CREATE_TIMEOUT_SECONDS', 120))
+
+    # Download proxy
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+    DOWNLOAD_READ_TIMEOUT = float(os.getenv('DOWNLOAD_READ_TIMEOUT', 30))
+
+    # Media store for combined outputs and audio tracks
+    MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(DATA_DIR, 'media'))
+    MEDIA_BUDGET_BYTES = int(os.getenv('MEDIA_BUDGET_BYTES', 5 * 1024 ** 3))
+
+    # Playback renditions (HLS, poster, preview) made from each stored output
+    HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 4))
+    PREVIEW_HEIGHT = int(os.getenv('PREVIEW_HEIGHT', 240))
+    MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 365 * 24 * 3600))
+
+    # ffmpeg mux engine
+    MUX_WORKERS = int(os.getenv('MUX_WORKERS', os.cpu_count() or 2))
+    MUX_MAX_QUEUE = int(os.getenv('MUX_MAX_QUEUE', 200))
+    MUX_TIMEOUT_SECONDS = float(os.getenv('MUX_TIMEOUT_SECONDS', 120))
+    MUX_INPUT_TIMEOUT_SECONDS = float(os.getenv('MUX_INPUT_TIMEOUT_SECONDS', 30))
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 8))
+
+    # Keyframe images are resized to Luma's working resolution before hosting
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', os.cpu_count() or 2))
+    IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 1360))
+    IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', 90))
+    IMAGE_PASSTHROUGH_BYTES = int(os.getenv('IMAGE_PASSTHROUGH_BYTES', 1024 * 1024))
+
+    # Long-form videos: at most this many chained Luma segments per request
+    MAX_VIDEO_SEGMENTS = int(os.getenv('MAX_VIDEO_SEGMENTS', 12))
+
+    # Batch generation
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+    BATCH_DEFAULT_PARALLELISM = int(os.getenv('BATCH_DEFAULT_PARALLELISM', 4))
+    BATCH_MAX_PARALLELISM = int(os.getenv('BATCH_MAX_PARALLELISM', 16))
+
+    # Per-provider rate limits: token bucket (requests/second, burst) plus a concurrency cap
+    RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 5))
+    RATE_LIMIT_MAX_BACKOFF = float(os.getenv('RATE_LIMIT_MAX_BACKOFF', 30))
+    OPENAI_RATE_PER_SECOND = float(os.getenv('OPENAI_RATE_PER_SECOND', 50))
+    OPENAI_BURST = int(os.getenv('OPENAI_BURST', 50))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 32))
+    LUMA_RATE_PER_SECOND = float(os.getenv('LUMA_RATE_PER_SECOND', 10))
+    LUMA_BURST = int(os.getenv('LUMA_BURST', 20))
+    LUMA_MAX_CONCURRENCY = int(os.getenv('LUMA_MAX_CONCURRENCY', 16))
+    LUMA_MAX_CONCURRENT_GENERATIONS = int(os.getenv('LUMA_MAX_CONCURRENT_GENERATIONS', 20))
+    ELEVENLABS_RATE_PER_SECOND = float(os.getenv('ELEVENLABS_RATE_PER_SECOND', 5))
+    ELEVENLABS_BURST = int(os.getenv('ELEVENLABS_BURST', 5))
+    ELEVENLABS_MAX_CONCURRENCY = int(os.getenv('ELEVENLABS_MAX_CONCURRENCY', 4))
+    IMGBB_RATE_PER_SECOND = float(os.getenv('IMGBB_RATE_PER_SECOND', 5))
+    IMGBB_BURST = int(os.getenv('IMGBB_BURST', 10))
+    IMGBB_MAX_CONCURRENCY = int(os.getenv('IMGBB_MAX_CONCURRENCY', 8))
+
+    # Luma API location and completion callbacks. Callbacks are enabled when both
+    # the public base URL of this app and a shared secret are set.
+    LUMA_API_BASE = os.getenv('LUMA_API_BASE', 'https://api.lumalabs.ai/dream-machine/v1')
+    LUMA_CALLBACK_BASE_URL = os.getenv('LUMA_CALLBACK_BASE_URL')
+    LUMA_CALLBACK_SECRET = os.getenv('LUMA_CALLBACK_SECRET')
+    LUMA_CALLBACK_FALLBACK_INTERVAL = float(os.getenv('LUMA_CALLBACK_FALLBACK_INTERVAL', 60))
+    LUMA_CALLBACK_CHECK_INTERVAL = float(os.getenv('LUMA_CALLBACK_CHECK_INTERVAL', 1))
+
+    # Background provider health checks served by /healthz
+    HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv('HEALTH_CHECK_INTERVAL_SECONDS', 300))
+    HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv('HEALTH_PROBE_TIMEOUT_SECONDS', 5))
+
+    # Other provider endpoints; override to point the app at bench/fake_providers.py
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+    ELEVENLABS_BASE_URL = os.getenv('ELEVENLABS_BASE_URL')
+    IMGBB_UPLOAD_URL = os.getenv('IMGBB_UPLOAD_URL', 'https://api.imgbb.com/1/upload')
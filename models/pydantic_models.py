@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Literal, Optional
+
+LUMA_ASPECT_RATIOS = ("16:9", "9:16", "1:1", "4:3", "3:4", "21:9", "9:21")
 
 class VideoGenerationRequest(BaseModel):
     prompt: str
@@ -9,9 +11,33 @@ class EnhancedPrompt(BaseModel):
     aspect_ratio: str
     duration: int
 
+class GenerationPlan(BaseModel):
+    prompt: str = Field(min_length=1)
+    aspect_ratio: Literal[LUMA_ASPECT_RATIOS] = "16:9"
+    duration: int = Field(default=10, ge=1, le=10)
+    sound_description: str = Field(min_length=1)
+
+    @field_validator("prompt")
+    @classmethod
+    def limit_prompt(cls, value: str) -> str:
+        # Limit prompt to 100 words
+        return " ".join(value.split()[:100])
+
+    @field_validator("duration", mode="before")
+    @classmethod
+    def parse_duration(cls, value):
+        # Accept answers like "5 seconds"
+        if isinstance(value, str) and value.split():
+            return value.split()[0].rstrip("s")
+        return value
+
+    def enhanced_prompt(self) -> EnhancedPrompt:
+        return EnhancedPrompt(prompt=self.prompt, aspect_ratio=self.aspect_ratio, duration=self.duration)
+
 class VideoGenerationResponse(BaseModel):
     video_url: str
     audio_url: Optional[str] = None
+    generation_id: Optional[str] = None
 
     def to_dict(self):
         return {"video_url": self.video_url, "audio_url": self.audio_url}
@@ -20,11 +46,55 @@ class SoundEffectRequest(BaseModel):
     description: str
 
 class SoundEffectResponse(BaseModel):
-    audio_url: str
+    audio_url: Optional[str] = None
+    # Clip came from the sound cache; audio_url is still the job's own file
+    cached: bool = False
 
 class FinalVideoResponse(BaseModel):
     video_url: str
     audio_url: Optional[str] = None
+    # Media store id of the output, when it is stored locally
+    media_id: Optional[str] = None
 
     def to_dict(self):
         return {"video_url": self.video_url, "audio_url": self.audio_url}
+
+class PipelineRequest(BaseModel):
+    # Uploaded images survive a JSON round trip through the job store
+    model_config = ConfigDict(ser_json_bytes="base64", val_json_bytes="base64")
+
+    input_type: Optional[str] = None
+    prompt: Optional[str] = None
+    sound_effect_enabled: bool = False
+    # Number of chained Luma generations joined into one video
+    segments: int = 1
+    initial_image_url: Optional[str] = None
+    first_frame_url: Optional[str] = None
+    last_frame_url: Optional[str] = None
+    initial_image_bytes: Optional[bytes] = None
+    first_frame_bytes: Optional[bytes] = None
+    last_frame_bytes: Optional[bytes] = None
+
+class BatchItemRequest(BaseModel):
+    prompt: str
+    input_type: str = "text"
+    sound_effect_enabled: bool = False
+    segments: int = Field(default=1, ge=1)
+    url: Optional[str] = None
+    first_frame_url: Optional[str] = None
+    last_frame_url: Optional[str] = None
+
+    def to_pipeline_request(self) -> PipelineRequest:
+        return PipelineRequest(
+            input_type=self.input_type,
+            prompt=self.prompt,
+            sound_effect_enabled=self.sound_effect_enabled,
+            segments=self.segments,
+            initial_image_url=self.url,
+            first_frame_url=self.first_frame_url,
+            last_frame_url=self.last_frame_url,
+        )
+
+class BatchRequest(BaseModel):
+    items: List[BatchItemRequest] = Field(min_length=1)
+    parallelism: Optional[int] = Field(default=None, ge=1)
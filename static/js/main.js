@@ -16,6 +16,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const firstFrame = document.getElementById('first-frame');
     const lastFrame = document.getElementById('last-frame');
     const soundEffectToggle = document.getElementById('sound-effect-toggle');
+    const segmentsSelect = document.getElementById('segments');
 
     function createStarryBackground() {
         const container = document.body;
@@ -118,6 +119,7 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('prompt', prompt);
             formData.append('input_type', inputType.value);
             formData.append('sound_effect_enabled', soundEffectToggle.checked);
+            formData.append('segments', segmentsSelect.value);
 
             if (inputType.value === 'image_text') {
                 if (!initialImage.files[0]) {
@@ -134,7 +136,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 formData.append('last_frame', lastFrame.files[0]);
             }
 
-            const response = await fetch('/generate_video', {
+            const response = await fetch('/jobs', {
                 method: 'POST',
                 body: formData,
             });
@@ -144,8 +146,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.error || 'Failed to generate video');
             }
 
-            const data = await response.json();
-            await loadVideo(data.combined_video_url);
+            const job = await response.json();
+            const data = await followJob(job.job_id);
+            if (data.poster_url) {
+                generatedVideo.poster = data.poster_url;
+            }
+            await loadVideo(playbackUrl(data));
             setupDownloadButtons(data);
             showVideoContainer();
         } catch (error) {
@@ -156,6 +162,39 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    function followJob(jobId) {
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(`/jobs/${jobId}/events`);
+            events.addEventListener('stage', (e) => {
+                const data = JSON.parse(e.data);
+                buttonText.textContent = `${data.message}...`;
+            });
+            events.addEventListener('luma_state', (e) => {
+                const data = JSON.parse(e.data);
+                buttonText.textContent = `Generating the video (${data.state})...`;
+            });
+            events.addEventListener('video_ready', (e) => {
+                const data = JSON.parse(e.data);
+                // Show Luma's video right away; the mixed version replaces it once it is ready
+                loadVideo(data.video_url).then(showVideoContainer).catch(() => {});
+            });
+            events.addEventListener('completed', (e) => {
+                events.close();
+                resolve(JSON.parse(e.data).result);
+            });
+            events.addEventListener('failed', (e) => {
+                events.close();
+                reject(new Error(JSON.parse(e.data).error || 'Failed to generate video'));
+            });
+            events.onerror = () => {
+                // EventSource retries on its own unless the server refused the stream
+                if (events.readyState === EventSource.CLOSED) {
+                    reject(new Error('Lost connection to the server'));
+                }
+            };
+        });
+    }
+
     function setLoading(isLoading) {
         generateBtn.disabled = isLoading;
         buttonText.textContent = isLoading ? 'Generating...' : 'Generate Video';
@@ -166,6 +205,19 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function playbackUrl(data) {
+        // Native HLS (Safari, iOS) starts after the first segment instead of the whole file
+        if (data.hls_url && generatedVideo.canPlayType('application/vnd.apple.mpegurl')) {
+            return data.hls_url;
+        }
+        const connection = navigator.connection;
+        const constrained = connection && (connection.saveData || ['slow-2g', '2g', '3g'].includes(connection.effectiveType));
+        if (data.preview_url && constrained) {
+            return data.preview_url;
+        }
+        return data.combined_video_url;
+    }
+
     async function loadVideo(url) {
         return new Promise((resolve, reject) => {
             generatedVideo.src = url;
@@ -1,31 +1,44 @@
 import os
-import time
-import requests
-from datetime import datetime, timedelta
+import sys
 import base64
-from lumaai import LumaAI
 from dotenv import load_dotenv
 
 # Get the directory of the script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Make the project packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(script_dir))
+from utils import http_client
+from utils.luma_client import create_generation, wait_for_video
+from utils.luma_polling import generation_profile, LumaTimeoutError
+from config import Config
+
 # Construct the path to the .env file
 env_path = os.path.join(os.path.dirname(script_dir), '.env')
 
-# Load environment variables from .env file
-if os.path.exists(env_path):
-    load_dotenv(env_path)
-else:
-    raise FileNotFoundError(f"The .env file was not found at {env_path}")
+# API keys are read when the script runs, so importing this module has no side effects
+IMGBB_API_KEY = None
+LUMAAI_API_KEY = None
+
+def load_api_keys():
+    global IMGBB_API_KEY, LUMAAI_API_KEY
+
+    # Load environment variables from .env file
+    if os.path.exists(env_path):
+        load_dotenv(env_path)
+    else:
+        raise FileNotFoundError(f"The .env file was not found at {env_path}")
 
-# Get API keys from environment variables
-IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
-LUMAAI_API_KEY = os.getenv("LUMAI_API_KEY")  # Note the change here to match your .env file
+    # Get API keys from environment variables
+    IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
+    LUMAAI_API_KEY = os.getenv("LUMAI_API_KEY")  # Note the change here to match your .env file
 
-if not IMGBB_API_KEY or not LUMAAI_API_KEY:
-    raise ValueError("Please ensure IMGBB_API_KEY and LUMAI_API_KEY are set in your .env file")
+    if not IMGBB_API_KEY or not LUMAAI_API_KEY:
+        raise ValueError("Please ensure IMGBB_API_KEY and LUMAI_API_KEY are set in your .env file")
+    # The shared Luma client reads its key from Config
+    Config.LUMMA_API_KEY = LUMAAI_API_KEY
 
-print("WARNING: Never share your .env file or API keys publicly. Keep them secure.")
+    print("WARNING: Never share your .env file or API keys publicly. Keep them secure.")
 
 def list_image_files():
     return [f for f in os.listdir('.') if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
@@ -47,45 +60,38 @@ def choose_image(prompt):
 
 def upload_image(image_path):
     with open(image_path, "rb") as file:
-        url = "https://api.imgbb.com/1/upload"
+        url = Config.IMGBB_UPLOAD_URL
         payload = {
             "key": IMGBB_API_KEY,
             "image": base64.b64encode(file.read()),
         }
-        res = requests.post(url, payload)
+        res = http_client.post("imgbb", url, data=payload)
         if res.ok:
             return res.json()['data']['url']
         else:
             print(f"Failed to upload image: {res.text}")
             return None
 
-def create_generation(client, generation_params):
+def run_generation(generation_params):
     try:
-        generation = client.generations.create(**generation_params)
+        generation_id = create_generation(generation_params)
         print("Generation started. Waiting for completion...")
-        print(f"Generation ID: {generation.id}")
-        timeout = datetime.now() + timedelta(minutes=5)
-        while datetime.now() < timeout:
-            status = client.generations.get(id=generation.id)
-            if status.state == "completed":
-                video_url = status.assets.video
-                print("Generation completed successfully!")
-                return video_url
-            elif status.state == "failed":
-                print(f"Generation failed. Reason: {status.failure_reason}")
-                return None
-            time.sleep(5)
-        else:
-            print("Generation timed out after 5 minutes. You can check its status later using the generation ID.")
-            print(f"Generation ID: {generation.id}")
+        print(f"Generation ID: {generation_id}")
+
+        try:
+            video_url = wait_for_video(generation_id, generation_profile(generation_params), just_created=True)
+        except LumaTimeoutError as e:
+            print(f"{str(e)}. You can check its status later using the generation ID.")
             return None
+        print("Generation completed successfully!")
+        return video_url
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return None
 
 def download_video(video_url):
     if video_url:
-        response = requests.get(video_url, stream=True)
+        response = http_client.get("media", video_url, stream=True)
         output_file = "luma_generated_video.mp4"
         with open(output_file, 'wb') as file:
             file.write(response.content)
@@ -94,7 +100,7 @@ def download_video(video_url):
         print("Video URL not available. Generation may not have completed successfully.")
 
 def main():
-    client = LumaAI(auth_token=LUMAAI_API_KEY)
+    load_api_keys()
     print("Choose generation type:")
     print("1. Text to Video")
     print("2. Image to Video")
@@ -150,7 +156,7 @@ def main():
         print("Invalid choice. Exiting.")
         return
 
-    video_url = create_generation(client, params)
+    video_url = run_generation(params)
     download_video(video_url)
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models.pydantic_models import PipelineRequest, SoundEffectResponse, VideoGenerationResponse, FinalVideoResponse
+from utils.openai_helper import generate_plan_async
+from utils.lumma_helper_url import generate_video_async
+from utils.elevenlabs_helper import generate_sound_effect_async
+from utils.video_processor import combine_video_and_audio_async, store_video, package_video_async
+from utils.mux_engine import prefetch_video_async
+from utils.image_to_url_helper import upload_image_async
+from utils.first_last_helper import upload_first_last_frames_async
+from utils.pipeline import remove_files, execute_pipeline
+from utils.metrics import track_stage, pipeline_seconds
+from config import Config
+
+# asyncio counterpart of utils/pipeline.py: every provider call, poll and ffmpeg run awaits instead
+# of holding a thread, so one process can carry many generations that mostly wait on Luma.
+
+# The event loop only keeps weak references to tasks, so fire-and-forget cleanups are held here
+_background_tasks = set()
+
+# Long-form chains hold a thread for minutes, so they get their own bounded pool rather than the
+# loop's default executor, which DNS lookups and image preparation also depend on
+_long_form_executor = ThreadPoolExecutor(max_workers=Config.ASYNC_LONG_FORM_WORKERS, thread_name_prefix="long-form")
+
+async def generate_audio_async(description: str) -> SoundEffectResponse:
+    with track_stage("generate_sound"):
+        return await generate_sound_effect_async(description)
+
+async def discard_audio_async(audio_task: asyncio.Task):
+    # Wait for the audio branch of a failed pipeline and remove its temporary file
+    try:
+        sound_effect_response = await audio_task
+    except BaseException:
+        return
+    remove_files(sound_effect_response.audio_url)
+
+async def timed_prefetch_async(video_url: str) -> str:
+    with track_stage("prefetch_video"):
+        return await prefetch_video_async(video_url)
+
+async def run_pipeline_async(pipeline_request: PipelineRequest) -> dict:
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        result = await execute_pipeline_async(pipeline_request)
+        outcome = "success"
+        return result
+    finally:
+        pipeline_seconds.observe(time.monotonic() - started, outcome=outcome)
+
+async def execute_pipeline_async(pipeline_request: PipelineRequest) -> dict:
+    if pipeline_request.segments > 1:
+        # Long-form videos are rare and mostly sequential, so they run on the threaded pipeline
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(_long_form_executor, context.run, execute_pipeline, pipeline_request)
+
+    initial_image_url = pipeline_request.initial_image_url
+    first_frame_url = pipeline_request.first_frame_url
+    last_frame_url = pipeline_request.last_frame_url
+
+    if pipeline_request.input_type == 'image_text' and pipeline_request.initial_image_bytes:
+        with track_stage("upload_images"):
+            initial_image_url = await upload_image_async(Config.IMAGEDB_API_KEY, image_bytes=pipeline_request.initial_image_bytes)
+        logging.info(f"ImageDB returned URL: {initial_image_url}")
+    elif pipeline_request.input_type == 'first_last_frame' and pipeline_request.first_frame_bytes:
+        with track_stage("upload_images"):
+            first_frame_url, last_frame_url = await upload_first_last_frames_async(pipeline_request.first_frame_bytes, pipeline_request.last_frame_bytes)
+        logging.info(f"First frame URL: {first_frame_url}, Last frame URL: {last_frame_url}")
+
+    with track_stage("plan"):
+        plan = await generate_plan_async(pipeline_request.prompt)
+    enhanced_prompt = plan.enhanced_prompt()
+
+    audio_task = None
+    if pipeline_request.sound_effect_enabled:
+        audio_task = asyncio.create_task(generate_audio_async(plan.sound_description))
+
+    try:
+        with track_stage("generate_video"):
+            video_response = await generate_video_async(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url)
+    except BaseException:
+        if audio_task:
+            # Not awaited here: the cleanup finishes in the background once the audio branch does
+            cleanup = asyncio.ensure_future(discard_audio_async(audio_task))
+            _background_tasks.add(cleanup)
+            cleanup.add_done_callback(_background_tasks.discard)
+        raise
+
+    if audio_task is None:
+        try:
+            local_video_path = await timed_prefetch_async(video_response.video_url)
+        except Exception as e:
+            logging.warning(f"Video prefetch failed, returning the remote URL: {str(e)}")
+            local_video_path = None
+        return await keep_video_only_async(video_response, local_video_path)
+
+    prefetch_task = asyncio.create_task(timed_prefetch_async(video_response.video_url))
+
+    try:
+        with track_stage("await_audio"):
+            sound_effect_response = await audio_task
+    except Exception as e:
+        logging.error(f"Error in audio branch: {str(e)}")
+        sound_effect_response = SoundEffectResponse(audio_url=None)
+
+    try:
+        local_video_path = await prefetch_task
+    except Exception as e:
+        logging.warning(f"Video prefetch failed, muxing from the remote URL: {str(e)}")
+        local_video_path = None
+
+    if sound_effect_response.audio_url is None:
+        logging.warning("Sound effect generation failed. Returning video without audio.")
+        return await keep_video_only_async(video_response, local_video_path)
+
+    with track_stage("mix"):
+        final_video = await combine_video_and_audio_async(video_response, sound_effect_response, local_video_path=local_video_path)
+
+    return await package_output_async(final_video)
+
+async def package_output_async(final_video: FinalVideoResponse) -> dict:
+    result = {"combined_video_url": final_video.video_url, "separate_audio_url": final_video.audio_url}
+    if final_video.media_id:
+        with track_stage("package"):
+            result.update(await package_video_async(final_video.media_id))
+    return result
+
+async def keep_video_only_async(video_response: VideoGenerationResponse, local_video_path: str) -> dict:
+    if local_video_path is None:
+        return {"combined_video_url": video_response.video_url, "separate_audio_url": None}
+    return await package_output_async(store_video(local_video_path))
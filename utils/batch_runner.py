@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from config import Config
+from utils.job_queue import job_queue, QueueFullError
+from utils.pipeline import submit_pipeline_job
+
+class Batch:
+    def __init__(self, batch_id: str, requests: list, parallelism: int):
+        self.id = batch_id
+        self.requests = requests
+        self.parallelism = parallelism
+        self.items = [{"index": index, "status": "pending", "job_id": None, "result": None, "error": None} for index in range(len(requests))]
+        self.pending = deque(range(len(requests)))
+        self.running = 0
+        self.created_at = time.time()
+        self.finished_at = None
+        # Notified whenever an item changes state, for streaming readers
+        self.changed = threading.Condition()
+
+    def is_finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self, items: list = None):
+        items = self.items if items is None else items
+        counts = {}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return {
+            "batch_id": self.id,
+            "parallelism": self.parallelism,
+            "total": len(self.items),
+            "counts": counts,
+            "finished": self.is_finished(),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "items": items,
+        }
+
+class BatchRunner:
+    def __init__(self, job_queue, submit_fn, retention_seconds: int):
+        self._job_queue = job_queue
+        self._submit_fn = submit_fn
+        self._retention_seconds = retention_seconds
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def submit(self, requests: list, parallelism: int) -> Batch:
+        batch = Batch(str(uuid.uuid4()), requests, parallelism)
+        with self._lock:
+            self._prune()
+            self._batches[batch.id] = batch
+        logging.info(f"Batch {batch.id} accepted with {len(requests)} items, parallelism {parallelism}")
+        self._dispatch(batch)
+        return batch
+
+    def get(self, batch_id: str):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def describe(self, batch: Batch) -> dict:
+        with batch.changed:
+            items = [dict(item) for item in batch.items]
+            # Read-only: a queued item whose job has started shows as running. Terminal states are
+            # left to _on_item_done, which also stores the result and decides when the batch is done.
+            for item in items:
+                if item["status"] == "queued":
+                    job = self._job_queue.get(item["job_id"])
+                    if job and job.status != "queued":
+                        item["status"] = "running"
+            return batch.to_dict(items)
+
+    def stream(self, batch: Batch):
+        # Yields each item once it finishes, then a final summary
+        reported = set()
+        while True:
+            timed_out = False
+            with batch.changed:
+                done = [dict(item) for item in batch.items if item["status"] in ("completed", "failed") and item["index"] not in reported]
+                finished = batch.is_finished()
+                if not done and not finished:
+                    timed_out = not batch.changed.wait(timeout=15)
+            for item in done:
+                reported.add(item["index"])
+                yield {"type": "item", "batch_id": batch.id, **item}
+            if finished:
+                summary = self.describe(batch)
+                summary.pop("items")
+                yield {"type": "summary", **summary}
+                return
+            if timed_out:
+                # Keeps idle proxies from closing the connection
+                yield {"type": "heartbeat", "batch_id": batch.id}
+
+    def _dispatch(self, batch: Batch):
+        # Keep at most `parallelism` items of this batch in the job queue at a time
+        while True:
+            with batch.changed:
+                if not batch.pending or batch.running >= batch.parallelism:
+                    return
+                index = batch.pending.popleft()
+                batch.running += 1
+            try:
+                job = self._submit_fn(
+                    batch.requests[index],
+                    on_done=lambda job, index=index: self._on_item_done(batch, index, job),
+                )
+            except QueueFullError:
+                # The shared queue is saturated; hand the slot back and retry shortly
+                with batch.changed:
+                    batch.pending.appendleft(index)
+                    batch.running -= 1
+                threading.Timer(1.0, self._dispatch, args=(batch,)).start()
+                return
+            with batch.changed:
+                batch.items[index]["job_id"] = job.id
+                if batch.items[index]["status"] == "pending":
+                    batch.items[index]["status"] = "queued"
+                batch.changed.notify_all()
+
+    def _on_item_done(self, batch: Batch, index: int, job):
+        with batch.changed:
+            batch.items[index].update(status=job.status, job_id=job.id, result=job.result, error=job.error)
+            batch.running -= 1
+            if all(item["status"] in ("completed", "failed") for item in batch.items):
+                batch.finished_at = time.time()
+                logging.info(f"Batch {batch.id} finished")
+            batch.changed.notify_all()
+        self._dispatch(batch)
+
+    def _prune(self):
+        cutoff = time.time() - self._retention_seconds
+        expired = [batch_id for batch_id, batch in self._batches.items() if batch.finished_at and batch.finished_at < cutoff]
+        for batch_id in expired:
+            del self._batches[batch_id]
+
+batch_runner = BatchRunner(job_queue, submit_pipeline_job, Config.JOB_RETENTION_SECONDS)
@@ -0,0 +1,57 @@
+import os
+from flask import Response, request, send_file
+from utils import http_client
+from utils.metrics import bytes_transferred_total
+from config import Config
+
+# Conditional and partial-content request headers forwarded to the upstream server
+FORWARDED_REQUEST_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+FORWARDED_RESPONSE_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified', 'Cache-Control')
+MEDIA_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.mp4': 'video/mp4', '.jpg': 'image/jpeg', '.mp3': 'audio/mpeg'}
+
+def send_local_file(file_path: str, content_type: str = None):
+    # send_file answers Range and If-None-Match itself and streams from disk
+    response = send_file(file_path, mimetype=content_type, as_attachment=True, conditional=True, etag=True)
+    if response.content_length:
+        bytes_transferred_total.inc(response.content_length, transfer="download_local")
+    return response
+
+def send_media_file(file_path: str):
+    # Media ids are never reused, so players and CDNs may cache them indefinitely
+    content_type = MEDIA_TYPES.get(os.path.splitext(file_path)[1])
+    response = send_file(file_path, mimetype=content_type, conditional=True, etag=True, max_age=Config.MEDIA_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    if response.content_length:
+        bytes_transferred_total.inc(response.content_length, transfer="media")
+    return response
+
+def stream_remote_file(url: str, content_type: str = None):
+    # Werkzeug collapses "//" in paths, so a proxied "https://host/..." arrives as "https:/host/..."
+    for scheme in ('https:/', 'http:/'):
+        if url.startswith(scheme) and not url.startswith(scheme + '/'):
+            url = scheme + '/' + url[len(scheme):]
+    if not url.startswith(('https://', 'http://')):
+        raise ValueError(f"Unsupported download URL: {url}")
+
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    # Ask for the raw bytes so Content-Length and Content-Range stay valid when forwarded
+    headers['Accept-Encoding'] = 'identity'
+    upstream = http_client.get("media", url, stream=True, headers=headers, timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.DOWNLOAD_READ_TIMEOUT))
+    if upstream.status_code >= 400 and upstream.status_code != 416:
+        upstream.close()
+        upstream.raise_for_status()
+
+    response_headers = {name: upstream.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in upstream.headers}
+    response_headers['Content-Type'] = content_type or upstream.headers.get('Content-Type', 'application/octet-stream')
+    response_headers['Content-Disposition'] = f'attachment; filename={os.path.basename(url)}'
+
+    def generate():
+        try:
+            for chunk in upstream.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                bytes_transferred_total.inc(len(chunk), transfer="download_proxied")
+                yield chunk
+        finally:
+            upstream.close()
+
+    return Response(generate(), status=upstream.status_code, headers=response_headers, direct_passthrough=True)
@@ -1,26 +1,136 @@
+import hashlib
+import logging
 import os
+import re
+import shutil
 import tempfile
-from elevenlabs.client import ElevenLabs
-from config import Config
+from utils.http_client import get_elevenlabs_client, get_async_elevenlabs_client
+from utils.rate_limiter import call_with_limits, call_with_limits_async
+from utils.metrics import bytes_transferred_total
+from utils.kv_cache import PersistentCache
+from utils.media_store import media_store
 from models.pydantic_models import SoundEffectResponse
+from config import Config
 
-def generate_sound_effect(text: str):
+SOUND_DURATION_SECONDS = 10  # Adjust this value as needed
+SOUND_PROMPT_INFLUENCE = 0.3  # Adjust this value as needed
+
+# Maps a normalized description to the media store id of a clip synthesized for it
+sound_cache = PersistentCache(Config.CACHE_DB_PATH, "sound_effects", Config.SOUND_CACHE_TTL_SECONDS, Config.SOUND_CACHE_MAX_ENTRIES)
+
+FILLER_WORDS = {"a", "an", "the", "of", "on", "in", "at", "to", "for", "by", "from", "with", "and", "is", "are", "some", "sound", "sounds", "effect", "effects"}
+
+def normalize_description(text: str) -> str:
+    # Case, punctuation, word order, filler words and plurals don't change the clip we'd get back
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    stems = {word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words if word not in FILLER_WORDS}
+    return " ".join(sorted(stems))
+
+def sound_cache_key(text: str) -> str:
+    return hashlib.sha256(f"{SOUND_DURATION_SECONDS}|{SOUND_PROMPT_INFLUENCE}|{normalize_description(text)}".encode()).hexdigest()
+
+def link_or_copy(source_path: str) -> str:
+    # A second name for the clip: removing one (eviction, or the job's cleanup) leaves the other intact
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+    temp_file.close()
+    os.remove(temp_file.name)
+    try:
+        os.link(source_path, temp_file.name)
+    except OSError:
+        # e.g. the temp dir is on another filesystem; a vanished source still raises FileNotFoundError here
+        shutil.copyfile(source_path, temp_file.name)
+    return temp_file.name
+
+def cached_sound_effect(cache_key: str):
+    media_id = sound_cache.get(cache_key)
+    # The media store may have evicted the clip since it was cached
+    path = media_store.resolve(media_id) if media_id else None
+    if not path:
+        return None
+    try:
+        # The job works on its own link, so another job's eviction can't delete it before the mux
+        audio_path = link_or_copy(path)
+    except FileNotFoundError:
+        return None
+    logging.info(f"Using cached sound effect {media_id}")
+    return SoundEffectResponse(audio_url=audio_path, cached=True)
+
+def keep_sound_effect(cache_key: str, audio_path: str) -> SoundEffectResponse:
+    try:
+        media_id = media_store.add(link_or_copy(audio_path), media_store.new_id('sfx', '.mp3'), 'sound_effect')
+    except Exception as e:
+        logging.warning(f"Could not cache sound effect: {str(e)}")
+        return SoundEffectResponse(audio_url=audio_path)
+    sound_cache.set(cache_key, media_id)
+    return SoundEffectResponse(audio_url=audio_path)
+
+def synthesize_to_file(text: str) -> str:
+    client = get_elevenlabs_client()
+
+    result = client.text_to_sound_effects.convert(
+        text=text,
+        duration_seconds=SOUND_DURATION_SECONDS,
+        prompt_influence=SOUND_PROMPT_INFLUENCE,
+        # Retries happen in call_with_limits, so a 429 pauses the provider instead of sleeping in a slot
+        request_options={"max_retries": 0},
+    )
+
+    # Save the result to a temporary file. The audio streams while we iterate,
+    # so this has to happen inside the rate-limited call.
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
     try:
-        client = ElevenLabs(api_key=Config.ELEVENLABS_API_KEY)
-        
-        result = client.text_to_sound_effects.convert(
-            text=text,
-            duration_seconds=10,  # Adjust this value as needed
-            prompt_influence=0.3,  # Adjust this value as needed
-        )
-        
-        # Save the result to a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
         for chunk in result:
             temp_file.write(chunk)
+            bytes_transferred_total.inc(len(chunk), transfer="elevenlabs_audio")
+    except Exception:
+        temp_file.close()
+        os.remove(temp_file.name)
+        raise
+    temp_file.close()
+    return temp_file.name
+
+async def synthesize_to_file_async(text: str) -> str:
+    client = get_async_elevenlabs_client()
+
+    result = client.text_to_sound_effects.convert(
+        text=text,
+        duration_seconds=SOUND_DURATION_SECONDS,
+        prompt_influence=SOUND_PROMPT_INFLUENCE,
+        request_options={"max_retries": 0},
+    )
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+    try:
+        async for chunk in result:
+            temp_file.write(chunk)
+            bytes_transferred_total.inc(len(chunk), transfer="elevenlabs_audio")
+    except BaseException:
         temp_file.close()
-        
-        return SoundEffectResponse(audio_url=temp_file.name)
+        os.remove(temp_file.name)
+        raise
+    temp_file.close()
+    return temp_file.name
+
+def generate_sound_effect(text: str):
+    cache_key = sound_cache_key(text)
+    cached = cached_sound_effect(cache_key)
+    if cached:
+        return cached
+    try:
+        audio_path = call_with_limits("elevenlabs", synthesize_to_file, text)
+        return keep_sound_effect(cache_key, audio_path)
     except Exception as e:
         print(f"Error generating sound effect: {str(e)}")
         return SoundEffectResponse(audio_url=None)
+
+async def generate_sound_effect_async(text: str):
+    cache_key = sound_cache_key(text)
+    cached = cached_sound_effect(cache_key)
+    if cached:
+        return cached
+    try:
+        audio_path = await call_with_limits_async("elevenlabs", synthesize_to_file_async, text)
+        return keep_sound_effect(cache_key, audio_path)
+    except Exception as e:
+        logging.error(f"Error generating sound effect: {str(e)}")
+        return SoundEffectResponse(audio_url=None)
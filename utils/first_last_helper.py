@@ -1,16 +1,32 @@
+import asyncio
 import logging
-from utils.image_to_url_helper import upload_image
+from concurrent.futures import ThreadPoolExecutor
+from utils.image_to_url_helper import upload_image, upload_image_async
 from config import Config
 
-def upload_first_last_frames(first_image_path, last_image_path):
+def upload_first_last_frames(first_image_bytes, last_image_bytes):
     try:
-        first_image_url = upload_image(Config.IMAGEDB_API_KEY, image_path=first_image_path)
+        # The two frames are independent, so upload them side by side
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="frame-upload") as executor:
+            first_future = executor.submit(upload_image, Config.IMAGEDB_API_KEY, image_bytes=first_image_bytes)
+            last_future = executor.submit(upload_image, Config.IMAGEDB_API_KEY, image_bytes=last_image_bytes)
+            first_image_url = first_future.result()
+            last_image_url = last_future.result()
+
         print(f"First frame URL: {first_image_url}")
-        
-        last_image_url = upload_image(Config.IMAGEDB_API_KEY, image_path=last_image_path)
         print(f"Last frame URL: {last_image_url}")
-        
+
         return first_image_url, last_image_url
     except Exception as e:
         logging.error(f"Error uploading images: {str(e)}")
         return None, None
+
+async def upload_first_last_frames_async(first_image_bytes, last_image_bytes):
+    try:
+        return tuple(await asyncio.gather(
+            upload_image_async(Config.IMAGEDB_API_KEY, image_bytes=first_image_bytes),
+            upload_image_async(Config.IMAGEDB_API_KEY, image_bytes=last_image_bytes),
+        ))
+    except Exception as e:
+        logging.error(f"Error uploading images: {str(e)}")
+        return None, None
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from config import Config
+
+def generation_key(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+class GenerationRegistry:
+    def __init__(self, path: str, completed_ttl: float, creating_timeout: float, running_timeout: float):
+        self._path = path
+        self._completed_ttl = completed_ttl
+        self._creating_timeout = creating_timeout
+        self._running_timeout = running_timeout
+        self._local = threading.local()
+        # Single-flight within this process: key -> Future shared by every caller
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, state TEXT NOT NULL, generation_id TEXT, video_url TEXT, "
+                "owner TEXT, updated_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def run(self, key: str, create_fn, wait_fn) -> tuple:
+        # Returns (generation_id, video_url)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = self._shared_future()
+        if not leader:
+            logging.info(f"Attaching to in-flight generation {key[:12]}")
+            return future.result()
+
+        try:
+            generation = self._resolve(key, create_fn, wait_fn)
+            self._settle(future, result=generation)
+            return generation
+        except Exception as e:
+            self._settle(future, error=e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _shared_future(self) -> Future:
+        future = Future()
+        # Marked running so cancelling one waiter (e.g. via wrap_future) can't cancel it for everyone
+        future.set_running_or_notify_cancel()
+        return future
+
+    def _settle(self, future: Future, result: tuple = None, error: Exception = None):
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _resolve(self, key: str, create_fn, wait_fn) -> tuple:
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        while True:
+            row = self._get(key)
+            if row and row["state"] == "completed":
+                logging.info(f"Reusing completed generation {row['generation_id']} for {key[:12]}")
+                return row["generation_id"], row["video_url"]
+            if row and row["state"] == "running":
+                # Another worker process already created it; poll the same generation instead of paying again
+                logging.info(f"Attaching to generation {row['generation_id']} started by another worker")
+                return self._finish(key, row["generation_id"], wait_fn)
+            if row and row["state"] == "creating":
+                time.sleep(0.5)
+                continue
+            if self._claim(key, owner):
+                break
+
+        try:
+            generation_id = create_fn()
+        except Exception:
+            self._delete(key)
+            raise
+        self._update(key, state="running", generation_id=generation_id)
+        return self._finish(key, generation_id, wait_fn)
+
+    def _finish(self, key: str, generation_id: str, wait_fn) -> tuple:
+        try:
+            video_url = wait_fn(generation_id)
+        except Exception:
+            # Let the next identical request start over rather than attach to a dead generation
+            self._delete(key)
+            raise
+        self._update(key, state="completed", generation_id=generation_id, video_url=video_url)
+        return generation_id, video_url
+
+    async def run_async(self, key: str, create_fn, wait_fn) -> tuple:
+        # Coroutine version of run(); callers from both worlds share the same in-flight table
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = self._shared_future()
+        if not leader:
+            logging.info(f"Attaching to in-flight generation {key[:12]}")
+            # A cancelled follower only stops waiting; the shared future stays with the leader
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            generation = await self._resolve_async(key, create_fn, wait_fn)
+            self._settle(future, result=generation)
+            return generation
+        except BaseException as e:
+            # Cancellation of the leader must still release anyone attached to it
+            self._settle(future, error=e if isinstance(e, Exception) else Exception("Video generation was cancelled"))
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def _resolve_async(self, key: str, create_fn, wait_fn) -> tuple:
+        owner = f"{os.getpid()}:{threading.get_ident()}:{id(asyncio.current_task())}"
+        while True:
+            row = self._get(key)
+            if row and row["state"] == "completed":
+                logging.info(f"Reusing completed generation {row['generation_id']} for {key[:12]}")
+                return row["generation_id"], row["video_url"]
+            if row and row["state"] == "running":
+                logging.info(f"Attaching to generation {row['generation_id']} started by another worker")
+                return await self._finish_async(key, row["generation_id"], wait_fn)
+            if row and row["state"] == "creating":
+                await asyncio.sleep(0.5)
+                continue
+            if self._claim(key, owner):
+                break
+
+        try:
+            generation_id = await create_fn()
+        except BaseException:
+            self._delete(key)
+            raise
+        self._update(key, state="running", generation_id=generation_id)
+        return await self._finish_async(key, generation_id, wait_fn)
+
+    async def _finish_async(self, key: str, generation_id: str, wait_fn) -> tuple:
+        try:
+            video_url = await wait_fn(generation_id)
+        except BaseException:
+            self._delete(key)
+            raise
+        self._update(key, state="completed", generation_id=generation_id, video_url=video_url)
+        return generation_id, video_url
+
+    def _get(self, key: str):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT state, generation_id, video_url, updated_at FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            state, generation_id, video_url, updated_at = row
+            age = time.time() - updated_at
+            expired = (
+                (state == "completed" and age > self._completed_ttl)
+                or (state == "creating" and age > self._creating_timeout)
+                or (state == "running" and age > self._running_timeout)
+            )
+            if expired:
+                conn.execute("DELETE FROM generations WHERE key = ? AND updated_at = ?", (key, updated_at))
+                return None
+            return {"state": state, "generation_id": generation_id, "video_url": video_url}
+
+    def _claim(self, key: str, owner: str) -> bool:
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO generations (key, state, owner, updated_at) VALUES (?, 'creating', ?, ?)",
+                (key, owner, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def _update(self, key: str, state: str, generation_id: str, video_url: str = None):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE generations SET state = ?, generation_id = ?, video_url = ?, updated_at = ? WHERE key = ?",
+                (state, generation_id, video_url, time.time(), key),
+            )
+
+    def _delete(self, key: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+
+generation_registry = GenerationRegistry(
+    Config.CACHE_DB_PATH,
+    Config.GENERATION_DEDUP_TTL_SECONDS,
+    Config.GENERATION_CREATE_TIMEOUT_SECONDS,
+    Config.LUMA_POLL_DEADLINE_SECONDS + 60,
+)
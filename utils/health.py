@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+OPENAI_DEFAULT_BASE = "https://api.openai.com/v1"
+ELEVENLABS_DEFAULT_BASE = "https://api.elevenlabs.io"
+
+def probe_requests() -> dict:
+    # Read-only listings that cost nothing: no completions, syntheses or generations.
+    # imgbb has no such endpoint, so uploads are only checked by real traffic.
+    return {
+        "openai": (f"{(Config.OPENAI_BASE_URL or OPENAI_DEFAULT_BASE).rstrip('/')}/models", {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}),
+        "luma": (f"{Config.LUMA_API_BASE}/generations?limit=1", {"Authorization": f"Bearer {Config.LUMMA_API_KEY}"}),
+        "elevenlabs": (f"{(Config.ELEVENLABS_BASE_URL or ELEVENLABS_DEFAULT_BASE).rstrip('/')}/v1/models", {"xi-api-key": Config.ELEVENLABS_API_KEY}),
+    }
+
+class HealthMonitor:
+    def __init__(self, interval_seconds: float, timeout_seconds: float):
+        self._interval_seconds = interval_seconds
+        self._timeout_seconds = timeout_seconds
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # Probes bypass http_client: its retries and rate-limit slots would stretch a probe well past
+        # the timeout, and /healthz should not queue behind real traffic
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(max_retries=0))
+        self._session.mount("http://", HTTPAdapter(max_retries=0))
+
+    def start(self):
+        # Safe to call from every entry point; only the first call starts the thread
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self._interval_seconds)
+
+    def _probe(self, provider: str, url: str, headers: dict) -> dict:
+        started = time.monotonic()
+        try:
+            response = self._session.get(url, headers=headers, timeout=self._timeout_seconds)
+            response.close()
+            result = {"ok": response.ok, "status_code": response.status_code}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["latency_seconds"] = round(time.monotonic() - started, 3)
+        result["checked_at"] = time.time()
+        if not result["ok"]:
+            logging.warning(f"{provider} health check failed: {result}")
+        return result
+
+    def refresh(self):
+        probes = probe_requests()
+        # Probes run side by side so a slow provider doesn't delay the others
+        with ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="health-probe") as executor:
+            futures = {provider: executor.submit(self._probe, provider, url, headers) for provider, (url, headers) in probes.items()}
+            results = {provider: future.result() for provider, future in futures.items()}
+        with self._lock:
+            self._results = results
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            results = dict(self._results)
+        if not results:
+            status = "starting"
+        elif all(result["ok"] for result in results.values()):
+            status = "ok"
+        else:
+            status = "degraded"
+        return {"status": status, "checks": results}
+
+health_monitor = HealthMonitor(Config.HEALTH_CHECK_INTERVAL_SECONDS, Config.HEALTH_PROBE_TIMEOUT_SECONDS)
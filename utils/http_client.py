@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+from utils.rate_limiter import limiters, parse_retry_after, RETRYABLE_STATUS_CODES
+from utils.metrics import provider_request_seconds, provider_requests_total
+
+# One keep-alive session per provider so every call reuses pooled TCP/TLS connections
+_sessions = {}
+_clients = {}
+_lock = threading.Lock()
+# httpx async pools belong to the event loop that opened them: loop -> {provider: client}
+_async_clients = weakref.WeakKeyDictionary()
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=Config.HTTP_RETRIES,
+        backoff_factor=Config.HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRYABLE_STATUS_CODES,
+        # POST is not idempotent (a retried Luma create would pay twice), so only reads are retried
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        raise_on_status=False,
+        # 429s are left to the rate limiter, which pauses the whole provider instead of one thread
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_CONNECTIONS, pool_maxsize=Config.HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(provider: str) -> requests.Session:
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = _sessions[provider] = _build_session()
+        return session
+
+def _send(session: requests.Session, provider: str, method: str, url: str, **kwargs) -> requests.Response:
+    started = time.monotonic()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.RequestException:
+        provider_requests_total.inc(provider=provider, status="error")
+        raise
+    finally:
+        # For streamed responses this covers time to headers, not the body download
+        provider_request_seconds.observe(time.monotonic() - started, provider=provider)
+    provider_requests_total.inc(provider=provider, status=str(response.status_code))
+    return response
+
+def request(provider: str, method: str, url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT))
+    session = get_session(provider)
+    limiter = limiters.get(provider)
+    if limiter is None:
+        return _send(session, provider, method, url, **kwargs)
+
+    for attempt in range(Config.RATE_LIMIT_MAX_RETRIES + 1):
+        with limiter.slot():
+            response = _send(session, provider, method, url, **kwargs)
+        if response.status_code != 429 or attempt == Config.RATE_LIMIT_MAX_RETRIES:
+            return response
+        # A 429 means the request was not processed, so even a POST is safe to queue and resend
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        response.close()
+        limiter.pause(delay if delay is not None else min(Config.RATE_LIMIT_MAX_BACKOFF, 2 ** attempt))
+
+def get(provider: str, url: str, **kwargs) -> requests.Response:
+    return request(provider, "GET", url, **kwargs)
+
+def post(provider: str, url: str, **kwargs) -> requests.Response:
+    return request(provider, "POST", url, **kwargs)
+
+def _httpx_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=Config.HTTP_POOL_MAXSIZE, max_keepalive_connections=Config.HTTP_POOL_MAXSIZE)
+
+def get_openai_client():
+    from openai import OpenAI, DefaultHttpxClient
+    with _lock:
+        client = _clients.get("openai")
+        if client is None:
+            client = _clients["openai"] = OpenAI(
+                api_key=Config.OPENAI_API_KEY,
+                base_url=Config.OPENAI_BASE_URL,
+                timeout=Config.OPENAI_TIMEOUT,
+                # Retries happen in call_with_limits, so a 429 pauses the provider instead of sleeping in a slot
+                max_retries=0,
+                http_client=DefaultHttpxClient(limits=_httpx_limits()),
+            )
+        return client
+
+def get_elevenlabs_client():
+    from elevenlabs.client import ElevenLabs
+    with _lock:
+        client = _clients.get("elevenlabs")
+        if client is None:
+            client = _clients["elevenlabs"] = ElevenLabs(
+                api_key=Config.ELEVENLABS_API_KEY,
+                base_url=Config.ELEVENLABS_BASE_URL,
+                timeout=Config.ELEVENLABS_TIMEOUT,
+                httpx_client=httpx.Client(limits=_httpx_limits(), timeout=Config.ELEVENLABS_TIMEOUT, follow_redirects=True),
+            )
+        return client
+
+def _async_pool(name: str, factory):
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        client = clients[name] = factory()
+    return client
+
+def get_async_client(provider: str) -> httpx.AsyncClient:
+    return _async_pool(provider, lambda: httpx.AsyncClient(
+        timeout=httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+        # Transport-level retries only cover failed connects, which never reached the provider
+        transport=httpx.AsyncHTTPTransport(retries=Config.HTTP_RETRIES, limits=_httpx_limits()),
+    ))
+
+async def _send_async(client: httpx.AsyncClient, provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+    started = time.monotonic()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        provider_requests_total.inc(provider=provider, status="error")
+        raise
+    finally:
+        provider_request_seconds.observe(time.monotonic() - started, provider=provider)
+    provider_requests_total.inc(provider=provider, status=str(response.status_code))
+    return response
+
+async def request_async(provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+    # Same policy as request(): 429s pause the provider, 5xx are retried for reads only
+    client = get_async_client(provider)
+    limiter = limiters.get(provider)
+    throttled = server_errors = 0
+    while True:
+        if limiter:
+            async with limiter.async_slot():
+                response = await _send_async(client, provider, method, url, **kwargs)
+        else:
+            response = await _send_async(client, provider, method, url, **kwargs)
+
+        if response.status_code == 429 and limiter and throttled < Config.RATE_LIMIT_MAX_RETRIES:
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            limiter.pause(delay if delay is not None else min(Config.RATE_LIMIT_MAX_BACKOFF, 2 ** throttled))
+            throttled += 1
+        elif response.status_code in RETRYABLE_STATUS_CODES and method in ("GET", "HEAD") and server_errors < Config.HTTP_RETRIES:
+            await asyncio.sleep(Config.HTTP_RETRY_BACKOFF * 2 ** server_errors)
+            server_errors += 1
+        else:
+            return response
+
+def get_async_openai_client():
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return _async_pool("openai_sdk", lambda: AsyncOpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL,
+        timeout=Config.OPENAI_TIMEOUT,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=_httpx_limits()),
+    ))
+
+def get_async_elevenlabs_client():
+    from elevenlabs.client import AsyncElevenLabs
+    return _async_pool("elevenlabs_sdk", lambda: AsyncElevenLabs(
+        api_key=Config.ELEVENLABS_API_KEY,
+        base_url=Config.ELEVENLABS_BASE_URL,
+        timeout=Config.ELEVENLABS_TIMEOUT,
+        httpx_client=httpx.AsyncClient(limits=_httpx_limits(), timeout=Config.ELEVENLABS_TIMEOUT, follow_redirects=True),
+    ))
+
+async def close_async_clients():
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for name, client in clients.items():
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        elif hasattr(client, "close"):
+            await client.close()
@@ -0,0 +1,51 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def downscale_image(image_bytes: bytes, max_dimension: int, jpeg_quality: int) -> bytes:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if max(image.size) <= max_dimension and len(image_bytes) <= Config.IMAGE_PASSTHROUGH_BYTES:
+            return image_bytes
+        # Phone photos store their rotation in EXIF, which is lost on re-encode
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+        return output.getvalue()
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Created on first use so importing the app doesn't start worker processes
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Forking a busy threaded server can copy locks held by other threads into the children,
+            # so workers start from a clean process (spawn where forkserver isn't available, e.g. Windows)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(max_workers=Config.IMAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _executor
+
+def prepare_image(image_bytes: bytes) -> bytes:
+    if Image is None:
+        logging.warning("Pillow is not installed; uploading the image without resizing")
+        return image_bytes
+    try:
+        prepared = _get_executor().submit(downscale_image, image_bytes, Config.IMAGE_MAX_DIMENSION, Config.IMAGE_JPEG_QUALITY).result()
+    except Exception as e:
+        logging.warning(f"Image resize failed, uploading the original: {str(e)}")
+        return image_bytes
+    logging.info(f"Prepared image for upload: {len(image_bytes)} -> {len(prepared)} bytes")
+    return prepared
@@ -1,9 +1,34 @@
+import asyncio
 import requests
+import httpx
 import base64
+import hashlib
+import logging
 import os
+from utils import http_client
+from utils.kv_cache import PersistentCache
+from utils.image_processing import prepare_image
+from utils.metrics import bytes_transferred_total
+from config import Config
 
-def upload_image(api_key, image_path=None, image_url=None):
-    url = "https://api.imgbb.com/1/upload"
+# Maps the content hash of an uploaded image (or the source URL) to its hosted imgbb URL
+upload_cache = PersistentCache(Config.CACHE_DB_PATH, "image_uploads", Config.UPLOAD_CACHE_TTL_SECONDS, Config.UPLOAD_CACHE_MAX_ENTRIES)
+
+def upload_cache_key(image_bytes=None, image_url=None) -> str:
+    if image_bytes:
+        # Keyed on the original bytes so a cache hit also skips the resize
+        return f"sha256:{hashlib.sha256(image_bytes).hexdigest()}"
+    elif image_url:
+        return f"url:{image_url}"
+    raise ValueError("One of image_path, image_bytes or image_url must be provided")
+
+def hosted_url(json_data: dict) -> str:
+    if json_data["success"]:
+        return json_data["data"]["url"]
+    raise Exception(f"Upload failed: {json_data.get('error', {}).get('message', 'Unknown error')}")
+
+def upload_image(api_key, image_path=None, image_url=None, image_bytes=None):
+    url = Config.IMGBB_UPLOAD_URL
     payload = {
         "key": api_key,
     }
@@ -12,19 +37,53 @@ def upload_image(api_key, image_path=None, image_url=None):
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"The file {image_path} does not exist.")
         with open(image_path, "rb") as file:
-            payload["image"] = base64.b64encode(file.read())
-    elif image_url:
-        payload["image"] = image_url
+            image_bytes = file.read()
+
+    cache_key = upload_cache_key(image_bytes, image_url)
+    cached_url = upload_cache.get(cache_key)
+    if cached_url:
+        logging.info(f"Reusing hosted image for {cache_key}: {cached_url}")
+        return cached_url
+
+    if image_bytes:
+        payload["image"] = base64.b64encode(prepare_image(image_bytes))
+        bytes_transferred_total.inc(len(payload["image"]), transfer="imgbb_upload")
     else:
-        raise ValueError("Either image_path or image_url must be provided")
+        payload["image"] = image_url
 
     try:
-        response = requests.post(url, payload)
+        response = http_client.post("imgbb", url, data=payload)
         response.raise_for_status()
-        json_data = response.json()
-        if json_data["success"]:
-            return json_data["data"]["url"]
-        else:
-            raise Exception(f"Upload failed: {json_data.get('error', {}).get('message', 'Unknown error')}")
+        result = hosted_url(response.json())
+        upload_cache.set(cache_key, result)
+        return result
     except requests.exceptions.RequestException as e:
         raise Exception(f"Network error occurred: {str(e)}")
+
+async def upload_image_async(api_key, image_url=None, image_bytes=None):
+    payload = {
+        "key": api_key,
+    }
+
+    cache_key = upload_cache_key(image_bytes, image_url)
+    cached_url = upload_cache.get(cache_key)
+    if cached_url:
+        logging.info(f"Reusing hosted image for {cache_key}: {cached_url}")
+        return cached_url
+
+    if image_bytes:
+        # Resizing waits on the image process pool, so keep it off the event loop
+        prepared = await asyncio.to_thread(prepare_image, image_bytes)
+        payload["image"] = base64.b64encode(prepared).decode()
+        bytes_transferred_total.inc(len(payload["image"]), transfer="imgbb_upload")
+    else:
+        payload["image"] = image_url
+
+    try:
+        response = await http_client.request_async("imgbb", "POST", Config.IMGBB_UPLOAD_URL, data=payload)
+        response.raise_for_status()
+        result = hosted_url(response.json())
+        upload_cache.set(cache_key, result)
+        return result
+    except httpx.HTTPError as e:
+        raise Exception(f"Network error occurred: {str(e)}")
@@ -0,0 +1,131 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from utils.metrics import job_wait_seconds
+
+# Id of the job the current worker thread is running, if any
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = "queued"
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Progress events for /jobs/<id>/events, numbered so clients can resume
+        self.events = []
+        self.changed = threading.Condition()
+
+    def emit(self, event: str, **data):
+        with self.changed:
+            if event == "stage":
+                self.stage = data.get("stage")
+            self.events.append({"id": len(self.events) + 1, "event": event, "data": data, "time": time.time()})
+            self.changed.notify_all()
+
+    def events_after(self, last_id: int, timeout: float):
+        # Returns the events newer than last_id, waiting up to timeout for one to arrive
+        with self.changed:
+            if last_id > len(self.events):
+                # An id from an earlier run of a resumed job; its log restarted at 1, so replay it
+                last_id = 0
+            if len(self.events) <= last_id and self.finished_at is None:
+                self.changed.wait(timeout=timeout)
+            return self.events[last_id:]
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobQueue:
+    def __init__(self, max_workers: int, max_pending: int, retention_seconds: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-worker")
+        self._max_pending = max_pending
+        self._retention_seconds = retention_seconds
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, error_formatter=str, on_done=None, job_id: str = None) -> Job:
+        with self._lock:
+            self._prune()
+            if self._pending >= self._max_pending:
+                raise QueueFullError(f"Job queue is full ({self._max_pending} pending jobs)")
+            job = Job(job_id or str(uuid.uuid4()))
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, fn, args, error_formatter, on_done)
+        logging.info(f"Job {job.id} queued")
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def _run(self, job: Job, fn, args, error_formatter, on_done):
+        job.status = "running"
+        job.started_at = time.time()
+        job_wait_seconds.observe(job.started_at - job.created_at)
+        token = current_job_id.set(job.id)
+        try:
+            job.result = fn(*args)
+            job.status = "completed"
+            logging.info(f"Job {job.id} completed")
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {str(e)}")
+            job.error = error_formatter(e)
+            job.status = "failed"
+        finally:
+            # Set together with the final event, so a finished job never lacks it
+            with job.changed:
+                job.finished_at = time.time()
+                job.emit(job.status, result=job.result, error=job.error)
+            current_job_id.reset(token)
+            with self._lock:
+                self._pending -= 1
+        if on_done:
+            try:
+                on_done(job)
+            except Exception as e:
+                logging.error(f"Completion callback for job {job.id} failed: {str(e)}")
+
+    def _prune(self):
+        # Forget finished jobs once they are older than the retention window
+        cutoff = time.time() - self._retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+job_queue = JobQueue(Config.JOB_WORKERS, Config.JOB_MAX_PENDING, Config.JOB_RETENTION_SECONDS)
+
+def report_progress(event: str, **data):
+    # No-op outside a queued job, e.g. for the synchronous /generate_video route
+    job_id = current_job_id.get()
+    if job_id is None:
+        return
+    job = job_queue.get(job_id)
+    if job is not None:
+        job.emit(event, **data)
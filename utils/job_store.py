@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import Config
+from utils.job_queue import current_job_id, QueueFullError
+
+# Jobs in these states still owe their caller a video
+UNFINISHED_STATES = ("queued", "timed_out")
+
+class JobStore:
+    def __init__(self, path: str, retention_seconds: float):
+        self._path = path
+        self._retention_seconds = retention_seconds
+        self._local = threading.local()
+        # Identifies this process, so a restart under the same pid is not mistaken for the old process
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, result TEXT, error TEXT, "
+                "owner TEXT, attempts INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            # One row per finished stage; separate rows let the audio and video branches write concurrently
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_stages ("
+                "job_id TEXT NOT NULL, stage TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (job_id, stage))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, request_json: str):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, request, owner, attempts, created_at, updated_at) VALUES (?, 'queued', ?, ?, 1, ?, ?)",
+                (job_id, request_json, self.owner, now, now),
+            )
+            self._prune(conn, now)
+
+    def delete(self, job_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM job_stages WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def record(self, job_id: str, stage: str, value):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO job_stages (job_id, stage, value) VALUES (?, ?, ?)", (job_id, stage, json.dumps(value)))
+
+    def stages(self, job_id: str) -> dict:
+        rows = self._connection().execute("SELECT stage, value FROM job_stages WHERE job_id = ?", (job_id,)).fetchall()
+        return {stage: json.loads(value) for stage, value in rows}
+
+    def finish(self, job_id: str, status: str, result: dict = None, error: str = None):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str):
+        row = self._connection().execute(
+            "SELECT status, result, error, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, created_at, updated_at = row
+        finished = status not in UNFINISHED_STATES
+        return {
+            "job_id": job_id,
+            "status": status,
+            "stage": None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "started_at": None,
+            "finished_at": updated_at if finished else None,
+        }
+
+    def _owner_alive(self, owner: str) -> bool:
+        if owner == self.owner:
+            return True
+        try:
+            pid = int((owner or "").split(":")[0])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            # Same pid, different token: an earlier incarnation of this process (e.g. pid 1 in a container)
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def claim_unfinished(self, max_attempts: int) -> list:
+        # Queued jobs of dead processes and timed-out jobs, taken over by this process
+        conn = self._connection()
+        # Requests carry the uploaded images, so they are only read for jobs this process actually claims
+        rows = conn.execute(
+            f"SELECT job_id, status, owner FROM jobs WHERE status IN ({', '.join('?' for _ in UNFINISHED_STATES)}) AND attempts < ?",
+            (*UNFINISHED_STATES, max_attempts),
+        ).fetchall()
+        claimed = []
+        for job_id, status, owner in rows:
+            if status == "queued" and self._owner_alive(owner):
+                continue
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE job_id = ? AND status = ? AND owner IS ?",
+                    (self.owner, time.time(), job_id, status, owner),
+                )
+            # Another worker may have claimed it first
+            if cursor.rowcount == 1:
+                request_json = conn.execute("SELECT request FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+                claimed.append((job_id, request_json))
+        return claimed
+
+    def release(self, job_id: str):
+        # Hand a claimed job back for a later sweep without spending an attempt
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET owner = NULL, attempts = attempts - 1 WHERE job_id = ?", (job_id,))
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        # Jobs untouched this long are finished or have run out of attempts
+        cutoff = now - self._retention_seconds
+        conn.execute("DELETE FROM job_stages WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)", (cutoff,))
+        conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+
+class RecoverySweeper:
+    def __init__(self, store: JobStore, resume_fn, interval_seconds: float, max_attempts: int):
+        self._store = store
+        self._resume_fn = resume_fn
+        self._interval_seconds = interval_seconds
+        self._max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        # Safe to call from every entry point; only the first call starts the thread
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="job-recovery", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Job recovery sweep failed: {str(e)}")
+            time.sleep(self._interval_seconds)
+
+    def sweep(self):
+        for job_id, request_json in self._store.claim_unfinished(self._max_attempts):
+            logging.info(f"Resuming job {job_id}")
+            try:
+                self._resume_fn(job_id, request_json)
+            except QueueFullError:
+                self._store.release(job_id)
+                logging.warning(f"Job queue is full; job {job_id} will be resumed later")
+
+job_store = JobStore(Config.JOB_STORE_PATH, Config.JOB_STORE_RETENTION_SECONDS)
+
+def record_stage(stage: str, value):
+    # No-op outside a queued job, like report_progress
+    job_id = current_job_id.get()
+    if job_id is not None:
+        job_store.record(job_id, stage, value)
+
+def completed_stages() -> dict:
+    job_id = current_job_id.get()
+    return job_store.stages(job_id) if job_id is not None else {}
@@ -0,0 +1,125 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class PersistentCache:
+    def __init__(self, path: str, name: str, ttl_seconds: float, max_entries: int, memory_entries: int = 0):
+        self._path = path
+        self._table = name
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._local = threading.local()
+        # Optional in-process LRU tier in front of sqlite
+        self._memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self._table}_last_access ON {self._table} (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        value = self._memory_get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        value = self._disk_get(key)
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._memory_set(key, value[0], value[1])
+        return value[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        self._count("writes")
+        self._memory_set(key, value, now)
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache write failed for {self._table}: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _memory_get(self, key: str):
+        if not self._memory_entries:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if time.time() - created_at > self._ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: str, created_at: float):
+        if not self._memory_entries:
+            return
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str):
+        try:
+            with self._connection() as conn:
+                row = conn.execute(f"SELECT value, created_at FROM {self._table} WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                value, created_at = row
+                now = time.time()
+                if now - created_at > self._ttl_seconds:
+                    conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                    return None
+                conn.execute(f"UPDATE {self._table} SET last_access = ? WHERE key = ?", (now, key))
+                return value, created_at
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read failed for {self._table}: {str(e)}")
+            return None
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute(f"DELETE FROM {self._table} WHERE created_at < ?", (now - self._ttl_seconds,))
+        count = conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+        if count > self._max_entries:
+            # Drop the least recently used entries beyond the size bound
+            conn.execute(
+                f"DELETE FROM {self._table} WHERE key IN "
+                f"(SELECT key FROM {self._table} ORDER BY last_access ASC LIMIT ?)",
+                (count - self._max_entries,),
+            )
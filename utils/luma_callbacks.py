@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+def callbacks_enabled() -> bool:
+    return bool(Config.LUMA_CALLBACK_BASE_URL and Config.LUMA_CALLBACK_SECRET)
+
+def callback_url() -> str:
+    return f"{Config.LUMA_CALLBACK_BASE_URL.rstrip('/')}/luma/callback?token={Config.LUMA_CALLBACK_SECRET}"
+
+class CallbackHub:
+    # Callbacks can land on any worker process, so they are recorded in sqlite
+    # and each process's poller picks them up from there.
+    def __init__(self, path: str, retention_seconds: float):
+        self._path = path
+        self._retention_seconds = retention_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS luma_callbacks ("
+                "generation_id TEXT PRIMARY KEY, state TEXT NOT NULL, payload TEXT NOT NULL, received_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def deliver(self, payload: dict):
+        generation_id = payload["id"]
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO luma_callbacks (generation_id, state, payload, received_at) VALUES (?, ?, ?, ?)",
+                (generation_id, payload["state"], json.dumps(payload), now),
+            )
+            conn.execute("DELETE FROM luma_callbacks WHERE received_at < ?", (now - self._retention_seconds,))
+        logging.info(f"Luma callback for {generation_id}: {payload['state']}")
+
+    def latest_many(self, generation_ids: list) -> dict:
+        # One query for every generation the poller is waiting on
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT generation_id, payload FROM luma_callbacks WHERE generation_id IN ({', '.join('?' for _ in generation_ids)})",
+                list(generation_ids),
+            ).fetchall()
+        return {generation_id: json.loads(payload) for generation_id, payload in rows}
+
+callback_hub = CallbackHub(Config.CACHE_DB_PATH, 24 * 3600)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from config import Config
+from utils import http_client
+from utils.luma_polling import GenerationPoller
+from utils.job_queue import report_progress
+from utils.job_store import record_stage
+from utils.luma_callbacks import callbacks_enabled, callback_url
+
+# The one place that talks to the Luma generations API; the pipelines and the scripts in utils/ go through it
+
+GENERATIONS_URL = f"{Config.LUMA_API_BASE}/generations"
+
+def luma_headers():
+    return {
+        "Authorization": f"Bearer {Config.LUMMA_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+def create_generation(data: dict) -> str:
+    logging.info(f"Sending initial request to Lumma API with data: {data}")
+
+    # The callback URL carries our secret, so it is added here rather than logged or used in dedup keys
+    body = dict(data, callback_url=callback_url()) if callbacks_enabled() else data
+    response = http_client.post("luma", GENERATIONS_URL, headers=luma_headers(), json=body)
+    response.raise_for_status()
+    generation_id = response.json()["id"]
+
+    logging.info(f"Video generation started. Generation ID: {generation_id}")
+    report_progress("luma_state", generation_id=generation_id, state="created")
+    # Persisted right away so a restarted job polls this generation instead of paying for a new one
+    record_stage("generation_id", generation_id)
+    return generation_id
+
+async def create_generation_async(data: dict) -> str:
+    logging.info(f"Sending initial request to Lumma API with data: {data}")
+
+    body = dict(data, callback_url=callback_url()) if callbacks_enabled() else data
+    response = await http_client.request_async("luma", "POST", GENERATIONS_URL, headers=luma_headers(), json=body)
+    response.raise_for_status()
+    generation_id = response.json()["id"]
+
+    logging.info(f"Video generation started. Generation ID: {generation_id}")
+    report_progress("luma_state", generation_id=generation_id, state="created")
+    return generation_id
+
+def fetch_generation(generation_id: str) -> dict:
+    status_response = http_client.get("luma", f"{GENERATIONS_URL}/{generation_id}", headers=luma_headers())
+    status_response.raise_for_status()
+    return status_response.json()
+
+def list_generations(limit: int, offset: int) -> dict:
+    response = http_client.get("luma", GENERATIONS_URL, headers=luma_headers(), params={"limit": limit, "offset": offset})
+    response.raise_for_status()
+    return response.json()
+
+generation_poller = GenerationPoller(
+    fetch_generation,
+    list_generations,
+    Config.LUMA_POLL_LIST_PAGE_SIZE,
+    Config.LUMA_POLL_LIST_MAX_PAGES,
+    Config.LUMA_POLL_LIST_MIN_BATCH,
+)
+
+def wait_for_video(generation_id: str, profile: str, just_created: bool = False) -> str:
+    status_data = generation_poller.watch(generation_id, profile, use_callbacks=callbacks_enabled(), just_created=just_created).result()
+    video_url = status_data["assets"]["video"]
+    logging.info(f"Video generation completed. Video URL: {video_url}")
+    return video_url
+
+async def wait_for_video_async(generation_id: str, profile: str, just_created: bool = False) -> str:
+    # Cancelling the awaiting task cancels the future, and the poller stops tracking it
+    status_data = await asyncio.wrap_future(generation_poller.watch(generation_id, profile, use_callbacks=callbacks_enabled(), just_created=just_created))
+    video_url = status_data["assets"]["video"]
+    logging.info(f"Video generation completed. Video URL: {video_url}")
+    return video_url
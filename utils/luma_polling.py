@@ -0,0 +1,293 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from config import Config
+from utils.job_queue import report_progress
+from utils.luma_callbacks import callback_hub
+from utils.metrics import luma_state_seconds, luma_status_checks_total
+
+class LumaTimeoutError(Exception):
+    def __init__(self, generation_id: str, waited: float):
+        super().__init__(f"Video generation timed out after {int(waited)}s (generation ID: {generation_id})")
+        self.generation_id = generation_id
+
+def generation_profile(data: dict) -> str:
+    # Completion times mostly depend on the output format and on how many keyframes Luma has to honor
+    keyframes = data.get("keyframes") or {}
+    if "frame1" in keyframes:
+        mode = "first_last"
+    elif (keyframes.get("frame0") or {}).get("type") == "generation":
+        mode = "extend"
+    elif "frame0" in keyframes:
+        mode = "image"
+    else:
+        mode = "text"
+    return f"{data.get('aspect_ratio', 'default')}|{data.get('duration_seconds', 'default')}|{mode}"
+
+class PollHistory:
+    def __init__(self, path: str, max_samples: int):
+        self._path = path
+        self._max_samples = max_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def expected_duration(self, profile: str):
+        with self._lock:
+            samples = self._samples.get(profile)
+            if not samples:
+                return None
+            return statistics.median(samples)
+
+    def record(self, profile: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(profile, deque(maxlen=self._max_samples)).append(round(seconds, 1))
+            snapshot = {key: list(values) for key, values in self._samples.items()}
+        self._save(snapshot)
+
+    def _load(self):
+        if not self._path or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            for profile, samples in data.items():
+                self._samples[profile] = deque(samples, maxlen=self._max_samples)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable Luma poll history at {self._path}: {str(e)}")
+
+    def _save(self, snapshot: dict):
+        if not self._path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            temp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            logging.warning(f"Could not persist Luma poll history: {str(e)}")
+
+class PollSchedule:
+    def __init__(self, expected: float):
+        self.expected = expected
+        self.started_at = time.monotonic()
+        self.interval = Config.LUMA_POLL_MIN_INTERVAL
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def next_delay(self) -> float:
+        elapsed = self.elapsed()
+        # Hold off until the job is close to its usual finish time
+        hold_until = self.expected * Config.LUMA_POLL_HOLD_FRACTION
+        if elapsed < hold_until:
+            delay = hold_until - elapsed
+        elif elapsed < self.expected * Config.LUMA_POLL_STALE_FACTOR:
+            # Around the expected finish, poll quickly so completion is noticed promptly
+            delay = Config.LUMA_POLL_MIN_INTERVAL
+        else:
+            # Running late: back off instead of hammering the status endpoint
+            self.interval = min(self.interval * 1.5, Config.LUMA_POLL_MAX_INTERVAL)
+            delay = self.interval
+        jitter = delay * Config.LUMA_POLL_JITTER
+        return max(0.5, delay + random.uniform(-jitter, jitter))
+
+poll_history = PollHistory(Config.LUMA_POLL_HISTORY_PATH, Config.LUMA_POLL_HISTORY_SAMPLES)
+
+class GenerationWatch:
+    # State shared by the blocking and asyncio wait loops: schedule, attempts, observed transitions
+    def __init__(self, generation_id: str, profile: str, deadline: float = None, use_callbacks: bool = False, just_created: bool = False):
+        self.generation_id = generation_id
+        self.profile = profile
+        # Only a wait that began at creation measures how long Luma took
+        self.just_created = just_created
+        self.deadline = deadline or Config.LUMA_POLL_DEADLINE_SECONDS
+        self.use_callbacks = use_callbacks
+        expected = poll_history.expected_duration(profile) or Config.LUMA_POLL_DEFAULT_EXPECTED
+        self.schedule = PollSchedule(expected)
+        self.attempt = 0
+        self.last_state = None
+        self.state_seen_at = 0.0
+        logging.info(f"Polling generation {generation_id} (profile {profile}, expected ~{int(expected)}s)")
+
+    def next_delay(self) -> float:
+        if not self.just_created and self.attempt == 0:
+            # Resumed or attached: it may have finished long ago, so check right away
+            return 0
+        delay = self.schedule.next_delay()
+        if self.use_callbacks:
+            # Luma pushes state changes to us; polling is only a safety net for lost callbacks
+            delay = max(delay, Config.LUMA_CALLBACK_FALLBACK_INTERVAL)
+        return min(delay, max(0, self.deadline - self.schedule.elapsed()))
+
+    def polling(self, source: str = "poll"):
+        self.attempt += 1
+        logging.info(f"Checking video generation status. Attempt {self.attempt} after {int(self.schedule.elapsed())}s")
+        luma_status_checks_total.inc(source=source)
+
+    def observe(self, status_data: dict) -> bool:
+        # Returns True once the generation completed; raises if it failed or ran out of time
+        if status_data["state"] != self.last_state:
+            # Durations are measured between observed transitions, so they include polling lag
+            if self.last_state is not None:
+                luma_state_seconds.observe(self.schedule.elapsed() - self.state_seen_at, state=self.last_state)
+                self.state_seen_at = self.schedule.elapsed()
+            self.last_state = status_data["state"]
+            report_progress("luma_state", generation_id=self.generation_id, state=self.last_state)
+
+        if status_data["state"] == "completed":
+            if self.just_created:
+                poll_history.record(self.profile, self.schedule.elapsed())
+            return True
+        elif status_data["state"] == "failed":
+            raise Exception(f"Video generation failed: {status_data.get('failure_reason') or 'Unknown reason'}")
+
+        logging.info(f"Video generation in progress. Current state: {status_data['state']}")
+        if self.schedule.elapsed() >= self.deadline:
+            raise LumaTimeoutError(self.generation_id, self.schedule.elapsed())
+        return False
+
+class PendingGeneration:
+    def __init__(self, watch: GenerationWatch):
+        self.watch = watch
+        self.future = Future()
+        # Progress events go to the job that started the wait, not to the poller thread
+        self.context = contextvars.copy_context()
+        self.due_at = time.monotonic() + watch.next_delay()
+
+class GenerationPoller:
+    # One thread refreshes every outstanding generation of this process. When several are due at
+    # once a page or two of the list endpoint replaces their individual GETs, so status traffic
+    # stays roughly flat as the number of generations in flight grows.
+    def __init__(self, fetch_fn, list_fn, page_size: int, max_pages: int, min_batch: int):
+        self._fetch_fn = fetch_fn
+        self._list_fn = list_fn
+        self._page_size = page_size
+        self._max_pages = max_pages
+        self._min_batch = min_batch
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, generation_id: str, profile: str, deadline: float = None, use_callbacks: bool = False, just_created: bool = False) -> Future:
+        # The future resolves with the final status, or fails like the old per-job loop did
+        pending = PendingGeneration(GenerationWatch(generation_id, profile, deadline, use_callbacks, just_created))
+        with self._lock:
+            self._pending.append(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="luma-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return pending.future
+
+    def outstanding(self) -> int:
+        with self._lock:
+            return sum(1 for item in self._pending if not item.future.done())
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Luma poller tick failed: {str(e)}")
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            pending = list(self._pending)
+        if not pending:
+            return Config.LUMA_POLL_MAX_INTERVAL
+        wait = min(item.due_at for item in pending) - time.monotonic()
+        if any(item.watch.use_callbacks for item in pending):
+            wait = min(wait, Config.LUMA_CALLBACK_CHECK_INTERVAL)
+        # Never spin: due generations are gathered into the next batch instead
+        return max(wait, Config.LUMA_POLL_BATCH_WINDOW)
+
+    def tick(self):
+        with self._lock:
+            # Waiters that gave up (e.g. a cancelled asyncio task) are simply dropped
+            self._pending = [item for item in self._pending if not item.future.done()]
+            pending = list(self._pending)
+        if not pending:
+            return
+
+        callback_ids = [item.watch.generation_id for item in pending if item.watch.use_callbacks]
+        if callback_ids:
+            pushed = callback_hub.latest_many(callback_ids)
+            for item in pending:
+                payload = pushed.get(item.watch.generation_id)
+                if payload and payload["state"] != item.watch.last_state:
+                    self._observe(item, payload, "callback")
+
+        now = time.monotonic()
+        due_ids = {item.watch.generation_id for item in pending if not item.future.done() and item.due_at <= now}
+        if not due_ids:
+            return
+        listed = {}
+        if len(due_ids) >= self._min_batch:
+            try:
+                listed = self._list_statuses(due_ids, {item.watch.generation_id for item in pending})
+            except Exception as e:
+                logging.warning(f"Listing Luma generations failed, polling them one by one: {str(e)}")
+        # Generations that fell off the listed pages are fetched on their own
+        fetched = {}
+        for generation_id in due_ids - listed.keys():
+            try:
+                fetched[generation_id] = self._fetch_fn(generation_id)
+            except Exception as e:
+                fetched[generation_id] = e
+
+        for item in pending:
+            if item.future.done():
+                continue
+            generation_id = item.watch.generation_id
+            if generation_id in listed:
+                self._observe(item, listed[generation_id], "list")
+            elif isinstance(fetched.get(generation_id), Exception):
+                self._settle(item, error=fetched[generation_id])
+            elif generation_id in fetched:
+                self._observe(item, fetched[generation_id], "poll")
+
+    def _list_statuses(self, due_ids: set, tracked_ids: set) -> dict:
+        # Newest first, so our outstanding generations are normally on the first page
+        statuses = {}
+        for page in range(self._max_pages):
+            listing = self._list_fn(self._page_size, page * self._page_size)
+            for generation in listing.get("generations") or []:
+                if generation.get("id") in tracked_ids:
+                    statuses[generation["id"]] = generation
+            if due_ids <= statuses.keys() or not listing.get("has_more"):
+                break
+        return statuses
+
+    def _observe(self, item: PendingGeneration, status_data: dict, source: str):
+        item.watch.polling(source)
+        try:
+            completed = item.context.run(item.watch.observe, status_data)
+        except Exception as e:
+            self._settle(item, error=e)
+            return
+        if completed:
+            self._settle(item, result=status_data)
+        else:
+            item.due_at = time.monotonic() + item.watch.next_delay()
+
+    def _settle(self, item: PendingGeneration, result: dict = None, error: Exception = None):
+        try:
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
+        except InvalidStateError:
+            # The waiter cancelled in the meantime
+            pass
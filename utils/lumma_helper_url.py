@@ -1,22 +1,26 @@
-import requests
-import time
 import logging
-from config import Config
+from utils.luma_client import create_generation, create_generation_async, wait_for_video, wait_for_video_async
+from utils.luma_polling import generation_profile
+from utils.generation_registry import generation_registry, generation_key
+from utils.rate_limiter import limiters
 from models.pydantic_models import EnhancedPrompt, VideoGenerationResponse
 
-def generate_video(enhanced_prompt: EnhancedPrompt, initial_image_url: str = None, first_frame_url: str = None, last_frame_url: str = None) -> VideoGenerationResponse:
-    headers = {
-        "Authorization": f"Bearer {Config.LUMMA_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
+def build_generation_payload(enhanced_prompt: EnhancedPrompt, initial_image_url: str = None, first_frame_url: str = None, last_frame_url: str = None, extend_generation_id: str = None) -> dict:
     data = {
         "prompt": enhanced_prompt.prompt,
         "aspect_ratio": enhanced_prompt.aspect_ratio,
         "duration_seconds": enhanced_prompt.duration
     }
 
-    if initial_image_url:
+    if extend_generation_id:
+        # Continue from the end of an earlier generation
+        data["keyframes"] = {
+            "frame0": {
+                "type": "generation",
+                "id": extend_generation_id
+            }
+        }
+    elif initial_image_url:
         data["keyframes"] = {
             "frame0": {
                 "type": "image",
@@ -35,33 +39,66 @@ def generate_video(enhanced_prompt: EnhancedPrompt, initial_image_url: str = Non
             }
         }
 
-    logging.info(f"Sending initial request to Lumma API with data: {data}")
+    return data
+
+def generate_video(enhanced_prompt: EnhancedPrompt, initial_image_url: str = None, first_frame_url: str = None, last_frame_url: str = None, resume_generation_id: str = None, extend_generation_id: str = None) -> VideoGenerationResponse:
+    data = build_generation_payload(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url, extend_generation_id=extend_generation_id)
+    profile = generation_profile(data)
+
+    # A generation slot is held from creation until Luma finishes, capping our concurrent generations
+    generation_slots = limiters["luma_generations"]
+    created = []
+
+    def create():
+        generation_slots.acquire()
+        if resume_generation_id:
+            logging.info(f"Resuming Luma generation {resume_generation_id}")
+            created.append(resume_generation_id)
+            return resume_generation_id
+        try:
+            generation_id = create_generation(data)
+        except Exception:
+            generation_slots.release()
+            raise
+        created.append(generation_id)
+        return generation_id
+
+    def wait(generation_id):
+        try:
+            # Resumed generations and ones attached from another worker started before this wait did
+            return wait_for_video(generation_id, profile, just_created=bool(created) and not resume_generation_id)
+        finally:
+            if created:
+                generation_slots.release()
 
-    response = requests.post("https://api.lumalabs.ai/dream-machine/v1/generations", headers=headers, json=data)
-    response.raise_for_status()
-    generation_id = response.json()["id"]
+    # Identical requests share one Luma generation, in flight or recently completed
+    generation_id, video_url = generation_registry.run(generation_key(data), create, wait)
+    return VideoGenerationResponse(video_url=video_url, generation_id=generation_id)
 
-    logging.info(f"Video generation started. Generation ID: {generation_id}")
+async def generate_video_async(enhanced_prompt: EnhancedPrompt, initial_image_url: str = None, first_frame_url: str = None, last_frame_url: str = None) -> VideoGenerationResponse:
+    data = build_generation_payload(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url)
+    profile = generation_profile(data)
 
-    video_url = None
-    max_attempts = 60
-    for attempt in range(max_attempts):
-        logging.info(f"Checking video generation status. Attempt {attempt + 1}/{max_attempts}")
-        status_response = requests.get(f"https://api.lumalabs.ai/dream-machine/v1/generations/{generation_id}", headers=headers)
-        status_response.raise_for_status()
-        status_data = status_response.json()
+    # Shares the generation slots and the dedup registry with the threaded pipeline
+    generation_slots = limiters["luma_generations"]
+    created = []
 
-        if status_data["state"] == "completed":
-            video_url = status_data["assets"]["video"]
-            logging.info(f"Video generation completed. Video URL: {video_url}")
-            break
-        elif status_data["state"] == "failed":
-            raise Exception(f"Video generation failed: {status_data.get('failure_reason', 'Unknown reason')}")
-        
-        logging.info(f"Video generation in progress. Current state: {status_data['state']}")
-        time.sleep(5)
+    async def create():
+        await generation_slots.acquire_async()
+        try:
+            generation_id = await create_generation_async(data)
+        except BaseException:
+            generation_slots.release()
+            raise
+        created.append(generation_id)
+        return generation_id
 
-    if not video_url:
-        raise Exception("Video generation timed out")
+    async def wait(generation_id):
+        try:
+            return await wait_for_video_async(generation_id, profile, just_created=bool(created))
+        finally:
+            if created:
+                generation_slots.release()
 
-    return VideoGenerationResponse(video_url=video_url)
\ No newline at end of file
+    generation_id, video_url = await generation_registry.run_async(generation_key(data), create, wait)
+    return VideoGenerationResponse(video_url=video_url, generation_id=generation_id)
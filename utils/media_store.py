@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from config import Config
+
+MEDIA_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+(\.[A-Za-z0-9]+)?$")
+
+class MediaStore:
+    def __init__(self, root: str, budget_bytes: int):
+        self._root = root
+        self._budget_bytes = budget_bytes
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL, job_id TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS media_last_access ON media (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self._root, "index.sqlite3"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def path_for(self, media_id: str) -> str:
+        # Shard on the first characters of the random part so no directory grows unbounded
+        stem = media_id.split("_", 1)[-1]
+        return os.path.join(self._root, stem[0:2], stem[2:4], media_id)
+
+    def new_id(self, prefix: str, extension: str) -> str:
+        return f"{prefix}_{uuid.uuid4().hex}{extension}"
+
+    def add(self, source_path: str, media_id: str, kind: str, job_id: str = None) -> str:
+        final_path = self.path_for(media_id)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        shutil.move(source_path, final_path)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO media (id, kind, size, created_at, last_access, job_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (media_id, kind, os.path.getsize(final_path), now, now, job_id),
+            )
+        logging.info(f"Stored {kind} {media_id} in media store")
+        self.evict()
+        return media_id
+
+    def resolve(self, media_id: str):
+        if not MEDIA_ID_PATTERN.match(media_id):
+            return None
+        with self._connection() as conn:
+            row = conn.execute("SELECT id FROM media WHERE id = ?", (media_id,)).fetchone()
+            if row is None:
+                return None
+            path = self.path_for(media_id)
+            if not os.path.exists(path):
+                conn.execute("DELETE FROM media WHERE id = ?", (media_id,))
+                return None
+            conn.execute("UPDATE media SET last_access = ? WHERE id = ?", (time.time(), media_id))
+            return path
+
+    def info(self, media_id: str):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, kind, size, created_at, last_access, job_id FROM media WHERE id = ?", (media_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "kind", "size", "created_at", "last_access", "job_id"), row))
+
+    def total_bytes(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM media").fetchone()[0]
+
+    def evict(self):
+        total = self.total_bytes()
+        if total <= self._budget_bytes:
+            return
+        with self._connection() as conn:
+            rows = conn.execute("SELECT id, size FROM media ORDER BY last_access ASC").fetchall()
+            for media_id, size in rows:
+                if total <= self._budget_bytes:
+                    break
+                try:
+                    os.remove(self.path_for(media_id))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Could not evict {media_id}: {str(e)}")
+                    continue
+                conn.execute("DELETE FROM media WHERE id = ?", (media_id,))
+                total -= size
+                logging.info(f"Evicted {media_id} ({size} bytes) from media store")
+
+media_store = MediaStore(Config.MEDIA_ROOT, Config.MEDIA_BUDGET_BYTES)
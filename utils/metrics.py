@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; wide enough for a 10 minute Luma generation. Fixed buckets keep memory
+# constant per label set, and Prometheus derives quantiles from them with histogram_quantile().
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Gauge:
+    # Read at scrape time from a callback returning a number or a {label values: number} dict.
+    # metric_type="counter" exposes totals that another component already keeps.
+    def __init__(self, name: str, help_text: str, fn, labelnames: tuple = (), metric_type: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.metric_type = metric_type
+        self._fn = fn
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        values = self._fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, fn, labelnames: tuple = (), metric_type: str = "gauge") -> Gauge:
+        return self._register(Gauge(name, help_text, fn, labelnames, metric_type))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# Metrics are per process; run one scrape target per worker process
+stage_seconds = registry.histogram("video_pipeline_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+stage_total = registry.counter("video_pipeline_stage_total", "Pipeline stages run, by outcome", ("stage", "outcome"))
+pipeline_seconds = registry.histogram("video_pipeline_seconds", "End-to-end pipeline time", ("outcome",))
+job_wait_seconds = registry.histogram("video_job_queue_wait_seconds", "Time jobs wait in the queue before a worker picks them up")
+provider_request_seconds = registry.histogram("provider_request_seconds", "Time spent in provider API calls", ("provider",))
+provider_requests_total = registry.counter("provider_requests_total", "Provider API calls, by status", ("provider", "status"))
+provider_slot_wait_seconds = registry.histogram("provider_slot_wait_seconds", "Time spent waiting for a provider rate-limit slot", ("provider",))
+luma_state_seconds = registry.histogram("luma_generation_state_seconds", "Time a Luma generation was seen in each state", ("state",))
+luma_status_checks_total = registry.counter("luma_status_checks_total", "Luma generation status updates, by source", ("source",))
+ffmpeg_seconds = registry.histogram("ffmpeg_seconds", "ffmpeg run time", ("outcome",))
+bytes_transferred_total = registry.counter("bytes_transferred_total", "Bytes moved to or from providers and clients", ("transfer",))
+
+@contextmanager
+def track_stage(stage: str):
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        stage_seconds.observe(time.monotonic() - started, stage=stage)
+        stage_total.inc(stage=stage, outcome=outcome)
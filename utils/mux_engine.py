@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from utils import http_client
+from utils.metrics import ffmpeg_seconds, bytes_transferred_total
+from utils.rate_limiter import ProviderLimiter
+from config import Config
+
+class MuxQueueFullError(Exception):
+    pass
+
+class MuxEngine:
+    # Each worker supervises one ffmpeg child process, so the pool size caps concurrent ffmpeg processes
+    def __init__(self, max_workers: int, max_queue: int, timeout: float):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ffmpeg")
+        self._max_queue = max_queue
+        self._timeout = timeout
+        self._outstanding = 0
+        self._lock = threading.Lock()
+        # One cap for the threaded and asyncio pipelines together; threads and coroutines queue in the same line
+        self._slots = ProviderLimiter("ffmpeg", 0, 1, max_workers)
+
+    def _reserve(self):
+        with self._lock:
+            if self._outstanding >= self._max_queue:
+                raise MuxQueueFullError(f"ffmpeg queue is full ({self._max_queue} jobs)")
+            self._outstanding += 1
+
+    def _unreserve(self):
+        with self._lock:
+            self._outstanding -= 1
+
+    def run(self, command: list, timeout: float = None) -> subprocess.CompletedProcess:
+        self._reserve()
+        try:
+            with self._slots.slot():
+                return self._executor.submit(self._execute, command, timeout or self._timeout).result()
+        finally:
+            self._unreserve()
+
+    async def run_async(self, command: list, timeout: float = None) -> subprocess.CompletedProcess:
+        self._reserve()
+        try:
+            async with self._slots.async_slot():
+                return await self._execute_async(command, timeout or self._timeout)
+        finally:
+            self._unreserve()
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._outstanding
+
+    def _execute(self, command: list, timeout: float) -> subprocess.CompletedProcess:
+        logging.info(f"Executing ffmpeg command: {' '.join(command)}")
+        started = time.monotonic()
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout, stdin=subprocess.DEVNULL)
+            ffmpeg_seconds.observe(time.monotonic() - started, outcome="success" if result.returncode == 0 else "error")
+            return result
+        except subprocess.TimeoutExpired:
+            # subprocess.run kills the child before raising, so nothing is left behind
+            logging.error(f"ffmpeg timed out after {timeout}s")
+            ffmpeg_seconds.observe(time.monotonic() - started, outcome="timeout")
+            return subprocess.CompletedProcess(command, returncode=-1, stdout="", stderr=f"Timed out after {timeout}s")
+
+    async def _execute_async(self, command: list, timeout: float) -> subprocess.CompletedProcess:
+        logging.info(f"Executing ffmpeg command: {' '.join(command)}")
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(*command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logging.error(f"ffmpeg timed out after {timeout}s")
+            ffmpeg_seconds.observe(time.monotonic() - started, outcome="timeout")
+            return subprocess.CompletedProcess(command, returncode=-1, stdout="", stderr=f"Timed out after {timeout}s")
+        except BaseException:
+            # Cancelled with the request: don't leave ffmpeg running
+            if process.returncode is None:
+                process.kill()
+            raise
+        ffmpeg_seconds.observe(time.monotonic() - started, outcome="success" if process.returncode == 0 else "error")
+        return subprocess.CompletedProcess(command, process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+
+def prefetch_video(video_url: str) -> str:
+    os.makedirs(Config.MEDIA_ROOT, exist_ok=True)
+    fd, local_path = tempfile.mkstemp(suffix=".mp4", dir=Config.MEDIA_ROOT)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            response = http_client.get("media", video_url, stream=True, timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.DOWNLOAD_READ_TIMEOUT))
+            with response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+                    bytes_transferred_total.inc(len(chunk), transfer="video_prefetch")
+    except Exception:
+        os.remove(local_path)
+        raise
+    logging.info(f"Prefetched video {video_url} to {local_path}")
+    return local_path
+
+async def prefetch_video_async(video_url: str) -> str:
+    os.makedirs(Config.MEDIA_ROOT, exist_ok=True)
+    fd, local_path = tempfile.mkstemp(suffix=".mp4", dir=Config.MEDIA_ROOT)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            client = http_client.get_async_client("media")
+            timeout = httpx.Timeout(Config.DOWNLOAD_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+            async with client.stream("GET", video_url, timeout=timeout) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(Config.DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+                    bytes_transferred_total.inc(len(chunk), transfer="video_prefetch")
+    except BaseException:
+        os.remove(local_path)
+        raise
+    logging.info(f"Prefetched video {video_url} to {local_path}")
+    return local_path
+
+mux_engine = MuxEngine(Config.MUX_WORKERS, Config.MUX_MAX_QUEUE, Config.MUX_TIMEOUT_SECONDS)
@@ -1,69 +1,91 @@
-import json
+import hashlib
 import logging
-from openai import OpenAI
+from pydantic import ValidationError
+from utils.http_client import get_openai_client, get_async_openai_client
+from utils.kv_cache import PersistentCache
+from utils.rate_limiter import call_with_limits, call_with_limits_async
+from models.pydantic_models import GenerationPlan, LUMA_ASPECT_RATIOS
 from config import Config
-from models.pydantic_models import EnhancedPrompt, SoundEffectRequest
 
-client = OpenAI(api_key=Config.OPENAI_API_KEY)
+PLAN_MODEL = "gpt-4o-mini"
+PLAN_SYSTEM_PROMPT = (
+    "You plan short AI-generated videos. Respond with a JSON object with exactly these keys: "
+    "'prompt' (a simple, concise video prompt of at most 100 words that's easy for video generation APIs to process), "
+    f"'aspect_ratio' (one of {', '.join(LUMA_ASPECT_RATIOS)}), "
+    "'duration' (whole seconds, 5 to 10), and "
+    "'sound_description' (a brief, specific sound effect description for the scene)."
+)
+# A response that doesn't validate is asked for again once before the request fails
+PLAN_ATTEMPTS = 2
 
-def generate_enhanced_prompt(prompt: str) -> EnhancedPrompt:
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Generate a simple, concise video prompt (max 100 words) that's easy for video generation APIs to process. Include 'prompt', 'aspect_ratio', and 'duration' in your JSON response."},
-                {"role": "user", "content": f"Create a video prompt based on: {prompt}"}
-            ]
-        )
-        content = response.choices[0].message.content
-        logging.info(f"Raw OpenAI response: {content}")
+plan_cache = PersistentCache(
+    Config.CACHE_DB_PATH,
+    "generation_plans",
+    Config.PROMPT_CACHE_TTL_SECONDS,
+    Config.PROMPT_CACHE_MAX_ENTRIES,
+    memory_entries=Config.PROMPT_CACHE_MEMORY_ENTRIES,
+)
 
-        # Remove markdown formatting if present
-        content = content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
+def plan_cache_key(prompt: str) -> str:
+    # Changing the model or the system prompt must not serve answers produced by the old one
+    normalized = " ".join((prompt or "").lower().split())
+    version = hashlib.sha256(f"{PLAN_MODEL}|{PLAN_SYSTEM_PROMPT}".encode()).hexdigest()[:12]
+    return hashlib.sha256(f"{version}|{normalized}".encode()).hexdigest()
 
-        logging.info(f"Content after removing markdown: {content}")
+def plan_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Create a video plan based on: {prompt}"}
+    ]
 
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding JSON: {e}")
-            logging.error(f"Content after removing markdown: {content}")
-            raise ValueError(f"Failed to parse OpenAI response as JSON: {e}")
+def plan_request(prompt: str) -> dict:
+    return {
+        "model": PLAN_MODEL,
+        "messages": plan_messages(prompt),
+        "response_format": {"type": "json_object"},
+    }
 
-        enhanced_prompt = data.get('prompt', prompt)
-        aspect_ratio = data.get('aspect_ratio', '16:9')
-        duration = data.get('duration', 10)
+def parse_plan(content: str) -> GenerationPlan:
+    logging.info(f"Raw OpenAI response: {content}")
+    return GenerationPlan.model_validate_json(content or "")
 
-        if isinstance(duration, str):
-            try:
-                duration = int(duration.split()[0])
-            except (ValueError, IndexError):
-                logging.warning(f"Failed to parse duration: {duration}. Using default value.")
-                duration = 10
+def cached_plan(cache_key: str):
+    cached = plan_cache.get(cache_key)
+    if cached:
+        logging.info("Using cached generation plan")
+        return GenerationPlan.model_validate_json(cached)
+    return None
 
-        # Limit prompt to 100 words
-        enhanced_prompt = ' '.join(enhanced_prompt.split()[:100])
+def generate_plan(prompt: str) -> GenerationPlan:
+    cache_key = plan_cache_key(prompt)
+    cached = cached_plan(cache_key)
+    if cached:
+        return cached
 
-        return EnhancedPrompt(prompt=enhanced_prompt, aspect_ratio=aspect_ratio, duration=duration)
+    for attempt in range(1, PLAN_ATTEMPTS + 1):
+        response = call_with_limits("openai", get_openai_client().chat.completions.create, **plan_request(prompt))
+        try:
+            result = parse_plan(response.choices[0].message.content)
+        except ValidationError as e:
+            logging.warning(f"Invalid generation plan (attempt {attempt}/{PLAN_ATTEMPTS}): {e}")
+            continue
+        plan_cache.set(cache_key, result.model_dump_json())
+        return result
+    raise Exception("Prompt processing failed: OpenAI did not return a valid generation plan")
 
-    except Exception as e:
-        logging.error(f"Unexpected error in generate_enhanced_prompt: {e}")
-        return EnhancedPrompt(prompt=prompt, aspect_ratio="16:9", duration=10)
+async def generate_plan_async(prompt: str) -> GenerationPlan:
+    cache_key = plan_cache_key(prompt)
+    cached = cached_plan(cache_key)
+    if cached:
+        return cached
 
-def generate_sound_effect_description(prompt: str) -> SoundEffectRequest:
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Generate a brief sound effect description for a short video scene (5 seconds or less). Keep it concise and specific."},
-            {"role": "user", "content": f"Create a sound effect description for: {prompt}"}
-        ]
-    )
-    description = response.choices[0].message.content
-    if description is None:
-        description = "Default sound effect"
-    return SoundEffectRequest(description=description)
+    for attempt in range(1, PLAN_ATTEMPTS + 1):
+        response = await call_with_limits_async("openai", get_async_openai_client().chat.completions.create, **plan_request(prompt))
+        try:
+            result = parse_plan(response.choices[0].message.content)
+        except ValidationError as e:
+            logging.warning(f"Invalid generation plan (attempt {attempt}/{PLAN_ATTEMPTS}): {e}")
+            continue
+        plan_cache.set(cache_key, result.model_dump_json())
+        return result
+    raise Exception("Prompt processing failed: OpenAI did not return a valid generation plan")
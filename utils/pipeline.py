@@ -0,0 +1,302 @@
+import contextvars
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from models.pydantic_models import PipelineRequest, SoundEffectResponse, GenerationPlan, VideoGenerationResponse, FinalVideoResponse
+from utils.openai_helper import generate_plan
+from utils.lumma_helper_url import generate_video
+from utils.elevenlabs_helper import generate_sound_effect
+from utils.video_processor import combine_video_and_audio, concatenate_segments, store_video, package_video
+from utils.mux_engine import prefetch_video
+from utils.image_to_url_helper import upload_image
+from utils.first_last_helper import upload_first_last_frames
+from utils.job_queue import job_queue, current_job_id, report_progress, QueueFullError
+from utils.job_store import job_store, record_stage, completed_stages, RecoverySweeper
+from utils.luma_polling import LumaTimeoutError
+from utils.metrics import track_stage, pipeline_seconds
+from config import Config
+
+# The audio branch only needs the plan's sound description, so it runs alongside Luma
+audio_executor = ThreadPoolExecutor(max_workers=Config.AUDIO_WORKERS, thread_name_prefix="audio-branch")
+# Downloads the finished Luma video while the audio branch is still running
+prefetch_executor = ThreadPoolExecutor(max_workers=Config.PREFETCH_WORKERS, thread_name_prefix="video-prefetch")
+
+def generate_audio(description: str, stored: dict = None) -> SoundEffectResponse:
+    # A resumed job reuses its clip if the file is still on disk
+    if stored and stored.get("audio_url") and os.path.exists(stored["audio_url"]):
+        return SoundEffectResponse.model_validate(stored)
+
+    # Generate sound effect using ElevenLabs API
+    logging.info("Step 4: Generating sound effect using ElevenLabs API")
+    report_progress("stage", stage="generating_sound", message="Synthesizing the sound effect")
+    with track_stage("generate_sound"):
+        sound_effect_response = generate_sound_effect(description)
+    if sound_effect_response.audio_url:
+        record_stage("audio", sound_effect_response.model_dump())
+    return sound_effect_response
+
+def discard_audio(audio_future):
+    # Remove the temporary audio file of a branch whose video never arrived
+    try:
+        sound_effect_response = audio_future.result()
+    except Exception:
+        return
+    audio_path = sound_effect_response.audio_url
+    if audio_path and os.path.exists(audio_path):
+        os.remove(audio_path)
+        logging.info(f"Temporary audio file removed: {audio_path}")
+
+def timed_prefetch(video_url: str) -> str:
+    with track_stage("prefetch_video"):
+        return prefetch_video(video_url)
+
+def remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def run_pipeline(pipeline_request: PipelineRequest) -> dict:
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        result = execute_pipeline(pipeline_request)
+        outcome = "success"
+        return result
+    finally:
+        pipeline_seconds.observe(time.monotonic() - started, outcome=outcome)
+
+def upload_inputs(pipeline_request: PipelineRequest) -> tuple:
+    initial_image_url = pipeline_request.initial_image_url
+    first_frame_url = pipeline_request.first_frame_url
+    last_frame_url = pipeline_request.last_frame_url
+
+    if pipeline_request.initial_image_bytes or pipeline_request.first_frame_bytes:
+        report_progress("stage", stage="uploading_images", message="Uploading images")
+    if pipeline_request.input_type == 'image_text' and pipeline_request.initial_image_bytes:
+        with track_stage("upload_images"):
+            initial_image_url = upload_image(Config.IMAGEDB_API_KEY, image_bytes=pipeline_request.initial_image_bytes)
+        logging.info(f"ImageDB returned URL: {initial_image_url}")
+    elif pipeline_request.input_type == 'first_last_frame' and pipeline_request.first_frame_bytes:
+        with track_stage("upload_images"):
+            first_frame_url, last_frame_url = upload_first_last_frames(pipeline_request.first_frame_bytes, pipeline_request.last_frame_bytes)
+        logging.info(f"First frame URL: {first_frame_url}, Last frame URL: {last_frame_url}")
+
+    return initial_image_url, first_frame_url, last_frame_url
+
+def execute_pipeline(pipeline_request: PipelineRequest) -> dict:
+    # Results of stages a previous attempt of this job already finished
+    stages = completed_stages()
+
+    if "uploads" in stages:
+        initial_image_url, first_frame_url, last_frame_url = stages["uploads"]
+    else:
+        initial_image_url, first_frame_url, last_frame_url = upload_inputs(pipeline_request)
+        record_stage("uploads", [initial_image_url, first_frame_url, last_frame_url])
+
+    if "plan" in stages:
+        plan = GenerationPlan.model_validate(stages["plan"])
+    else:
+        # One OpenAI call plans the video prompt, format and sound description
+        report_progress("stage", stage="planning", message="Enhancing the prompt")
+        with track_stage("plan"):
+            plan = generate_plan(pipeline_request.prompt)
+        record_stage("plan", plan.model_dump())
+    enhanced_prompt = plan.enhanced_prompt()
+    logging.info("Step 1: Generated the generation plan using OpenAI")
+
+    audio_future = None
+    if pipeline_request.sound_effect_enabled:
+        # Copy the context so the audio branch still reports progress to this job
+        audio_future = audio_executor.submit(contextvars.copy_context().run, generate_audio, plan.sound_description, stages.get("audio"))
+
+    if pipeline_request.segments > 1:
+        return execute_long_video(pipeline_request, enhanced_prompt, stages, audio_future, initial_image_url, first_frame_url, last_frame_url)
+
+    # Generate video using Lumma API
+    logging.info("Step 2: Generating video")
+    report_progress("stage", stage="generating_video", message="Generating the video")
+    try:
+        if "video_url" in stages:
+            video_response = VideoGenerationResponse(video_url=stages["video_url"])
+        else:
+            # A generation created by an earlier attempt is polled again instead of paid for twice
+            with track_stage("generate_video"):
+                video_response = generate_video(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url, resume_generation_id=stages.get("generation_id"))
+            record_stage("video_url", video_response.video_url)
+    except Exception:
+        if audio_future:
+            audio_future.add_done_callback(discard_audio)
+        raise
+    logging.info("Step 3: Video generation completed")
+    report_progress("video_ready", video_url=video_response.video_url)
+
+    if audio_future is None:
+        # If sound effect is disabled, the Luma video itself is the output
+        try:
+            local_video_path = timed_prefetch(video_response.video_url)
+        except Exception as e:
+            logging.warning(f"Video prefetch failed, returning the remote URL: {str(e)}")
+            local_video_path = None
+        return keep_video_only(video_response, local_video_path)
+
+    prefetch_future = prefetch_executor.submit(timed_prefetch, video_response.video_url)
+
+    try:
+        # Time the audio branch adds to the critical path once the video is ready
+        with track_stage("await_audio"):
+            sound_effect_response = audio_future.result()
+    except Exception as e:
+        logging.error(f"Error in audio branch: {str(e)}")
+        sound_effect_response = SoundEffectResponse(audio_url=None)
+
+    try:
+        local_video_path = prefetch_future.result()
+    except Exception as e:
+        # ffmpeg can still read the remote URL itself
+        logging.warning(f"Video prefetch failed, muxing from the remote URL: {str(e)}")
+        local_video_path = None
+
+    if sound_effect_response.audio_url is None:
+        logging.warning("Sound effect generation failed. Returning video without audio.")
+        return keep_video_only(video_response, local_video_path)
+
+    # Combine video and audio
+    logging.info("Step 5: Mixing video and sound effect")
+    report_progress("stage", stage="mixing", message="Mixing video and sound")
+    with track_stage("mix"):
+        final_video = combine_video_and_audio(video_response, sound_effect_response, job_id=current_job_id.get(), local_video_path=local_video_path)
+
+    return package_output(final_video)
+
+def package_output(final_video: FinalVideoResponse) -> dict:
+    result = {"combined_video_url": final_video.video_url, "separate_audio_url": final_video.audio_url}
+    if final_video.media_id:
+        # HLS, a poster and a preview let playback start without downloading the whole MP4
+        report_progress("stage", stage="packaging", message="Preparing playback")
+        with track_stage("package"):
+            result.update(package_video(final_video.media_id, job_id=current_job_id.get()))
+    return result
+
+def keep_video_only(video_response: VideoGenerationResponse, local_video_path: str) -> dict:
+    # Without audio to mix in, the downloaded Luma video becomes the output
+    if local_video_path is None:
+        return {"combined_video_url": video_response.video_url, "separate_audio_url": None}
+    return package_output(store_video(local_video_path, job_id=current_job_id.get()))
+
+def discard_prefetch(prefetch_future):
+    try:
+        local_video_path = prefetch_future.result()
+    except Exception:
+        return
+    remove_files(local_video_path)
+
+def generate_segments(enhanced_prompt, segments: int, stages: dict, initial_image_url: str, first_frame_url: str, last_frame_url: str, prefetch_futures: list) -> list:
+    # Each segment extends the previous generation, so they are generated one after another,
+    # while finished segments download in the background
+    completed = stages.get("segments", [])
+    for _, video_url in completed:
+        prefetch_futures.append(prefetch_executor.submit(timed_prefetch, video_url))
+    # Only the segment that was in flight when an earlier attempt stopped can be resumed
+    resume_generation_id = stages.get("generation_id")
+    if resume_generation_id in [generation_id for generation_id, _ in completed]:
+        resume_generation_id = None
+
+    for index in range(len(completed), segments):
+        report_progress("stage", stage="generating_video", message=f"Generating segment {index + 1} of {segments}")
+        with track_stage("generate_video"):
+            if completed:
+                video_response = generate_video(enhanced_prompt, extend_generation_id=completed[-1][0], resume_generation_id=resume_generation_id)
+            else:
+                video_response = generate_video(enhanced_prompt, initial_image_url=initial_image_url, first_frame_url=first_frame_url, last_frame_url=last_frame_url, resume_generation_id=resume_generation_id)
+        resume_generation_id = None
+        completed.append([video_response.generation_id, video_response.video_url])
+        record_stage("segments", completed)
+        report_progress("segment_ready", index=index, video_url=video_response.video_url)
+        prefetch_futures.append(prefetch_executor.submit(timed_prefetch, video_response.video_url))
+    return completed
+
+def execute_long_video(pipeline_request: PipelineRequest, enhanced_prompt, stages: dict, audio_future, initial_image_url: str, first_frame_url: str, last_frame_url: str) -> dict:
+    logging.info(f"Step 2: Generating {pipeline_request.segments} video segments")
+    prefetch_futures = []
+    try:
+        completed = generate_segments(enhanced_prompt, pipeline_request.segments, stages, initial_image_url, first_frame_url, last_frame_url, prefetch_futures)
+    except Exception:
+        for prefetch_future in prefetch_futures:
+            prefetch_future.add_done_callback(discard_prefetch)
+        if audio_future:
+            audio_future.add_done_callback(discard_audio)
+        raise
+    logging.info("Step 3: Video segments completed")
+
+    segment_paths = []
+    for prefetch_future, (_, video_url) in zip(prefetch_futures, completed):
+        try:
+            segment_paths.append(prefetch_future.result())
+        except Exception as e:
+            logging.warning(f"Segment prefetch failed, joining from the remote URL: {str(e)}")
+            segment_paths.append(video_url)
+
+    sound_effect_response = None
+    if audio_future:
+        try:
+            with track_stage("await_audio"):
+                sound_effect_response = audio_future.result()
+        except Exception as e:
+            logging.error(f"Error in audio branch: {str(e)}")
+        if sound_effect_response and sound_effect_response.audio_url is None:
+            sound_effect_response = None
+
+    # Join the segments and lay one audio bed over the whole video
+    logging.info("Step 5: Joining video segments")
+    report_progress("stage", stage="mixing", message="Joining the video segments")
+    with track_stage("mix"):
+        final_video = concatenate_segments(segment_paths, sound_effect_response, job_id=current_job_id.get())
+
+    return package_output(final_video)
+
+def describe_error(error: Exception) -> str:
+    error_message = "An unexpected error occurred during video generation."
+    if isinstance(error, LumaTimeoutError):
+        error_message = "The video is taking longer than usual to generate. Please check back later."
+    elif "Prompt processing failed" in str(error):
+        error_message = "The video prompt was too complex. Please try a simpler description."
+    elif "API key" in str(error):
+        error_message = "There was an issue with the API authentication. Please try again later."
+    elif "Invalid cross-device link" in str(error):
+        error_message = "An error occurred while processing the video. Please try again."
+    elif "audio_url" in str(error):
+        error_message = "An error occurred while generating or processing the audio. Please try again."
+    elif "429" in str(error) or "Too Many Requests" in str(error):
+        error_message = "Our video providers are busy right now. Please try again shortly."
+    return error_message
+
+def run_pipeline_job(job_id: str, pipeline_request: PipelineRequest) -> dict:
+    # Records the outcome so the recovery sweeper knows which jobs are unfinished
+    try:
+        result = run_pipeline(pipeline_request)
+    except LumaTimeoutError as e:
+        # The generation may still finish on Luma's side; the sweeper resumes polling it
+        job_store.finish(job_id, "timed_out", error=describe_error(e))
+        raise
+    except Exception as e:
+        job_store.finish(job_id, "failed", error=describe_error(e))
+        raise
+    job_store.finish(job_id, "completed", result=result)
+    return result
+
+def submit_pipeline_job(pipeline_request: PipelineRequest, on_done=None):
+    job_id = str(uuid.uuid4())
+    job_store.create(job_id, pipeline_request.model_dump_json())
+    try:
+        return job_queue.submit(run_pipeline_job, job_id, pipeline_request, error_formatter=describe_error, on_done=on_done, job_id=job_id)
+    except QueueFullError:
+        job_store.delete(job_id)
+        raise
+
+def resume_pipeline_job(job_id: str, request_json: str):
+    pipeline_request = PipelineRequest.model_validate_json(request_json)
+    job_queue.submit(run_pipeline_job, job_id, pipeline_request, error_formatter=describe_error, job_id=job_id)
+
+job_recovery = RecoverySweeper(job_store, resume_pipeline_job, Config.JOB_RECOVERY_INTERVAL_SECONDS, Config.JOB_MAX_ATTEMPTS)
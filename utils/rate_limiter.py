@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from config import Config
+from utils.metrics import provider_request_seconds, provider_requests_total, provider_slot_wait_seconds
+
+class ProviderLimiter:
+    def __init__(self, name: str, rate_per_second: float, burst: int, max_concurrency: int):
+        self.name = name
+        self._rate = rate_per_second
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        # Concurrency slots shared by worker threads and event loops. A released slot goes straight to
+        # the oldest waiter: a thread's Event or an event loop's future, so nobody polls for it.
+        self._free_slots = max_concurrency if max_concurrency > 0 else None
+        self._waiters = deque()
+        self._slot_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "throttled": 0, "in_flight": 0}
+
+    def acquire(self) -> float:
+        started = time.monotonic()
+        self._take_slot()
+        try:
+            while True:
+                delay = self._token_delay()
+                if not delay:
+                    break
+                time.sleep(delay)
+        except BaseException:
+            self._give_slot()
+            raise
+        return self._acquired(started)
+
+    async def acquire_async(self) -> float:
+        started = time.monotonic()
+        await self._take_slot_async()
+        try:
+            while True:
+                delay = self._token_delay()
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._give_slot()
+            raise
+        return self._acquired(started)
+
+    def _take_slot(self):
+        with self._slot_lock:
+            if self._free_slots is None:
+                return
+            if self._free_slots > 0 and not self._waiters:
+                self._free_slots -= 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted)
+        granted.wait()
+
+    async def _take_slot_async(self):
+        loop = asyncio.get_running_loop()
+        with self._slot_lock:
+            if self._free_slots is None:
+                return
+            if self._free_slots > 0 and not self._waiters:
+                self._free_slots -= 1
+                return
+            granted = loop.create_future()
+            self._waiters.append((loop, granted))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                # The slot arrived just as we were cancelled
+                self._give_slot()
+            else:
+                with self._slot_lock:
+                    if (loop, granted) in self._waiters:
+                        self._waiters.remove((loop, granted))
+            raise
+
+    def _give_slot(self):
+        with self._slot_lock:
+            if self._free_slots is None:
+                return
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, granted = waiter
+                try:
+                    loop.call_soon_threadsafe(self._grant_async, granted)
+                    return
+                except RuntimeError:
+                    # That event loop has closed
+                    continue
+            self._free_slots += 1
+
+    def _grant_async(self, granted: asyncio.Future):
+        # Runs on the waiter's loop; a waiter cancelled in the meantime passes the slot on
+        if granted.cancelled():
+            self._give_slot()
+        else:
+            granted.set_result(None)
+
+    def _acquired(self, started: float) -> float:
+        waited = time.monotonic() - started
+        provider_slot_wait_seconds.observe(waited, provider=self.name)
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_flight"] += 1
+            if waited > 0.01:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        if waited > 1:
+            logging.info(f"Waited {waited:.1f}s for a {self.name} request slot")
+        return waited
+
+    def release(self):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+        self._give_slot()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def pause(self, seconds: float):
+        # Called on a 429: nobody gets a token until the provider's Retry-After has passed
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._stats["throttled"] += 1
+        logging.warning(f"{self.name} rate limited; pausing requests for {seconds:.1f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _token_delay(self) -> float:
+        # Takes a token and returns 0, or returns how long to wait before trying again
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if not self._rate:
+                return 0
+            self._tokens = min(self._burst, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self._rate
+
+def parse_retry_after(value) -> float:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+# Floor for 429 pauses, so "Retry-After: 0" or a past date can't turn the pause into a busy retry
+MIN_THROTTLE_PAUSE = 0.5
+
+def _status_code(error: Exception):
+    response = getattr(error, "response", None)
+    return getattr(error, "status_code", None) or getattr(response, "status_code", None)
+
+def rate_limit_delay(error: Exception, attempt: int):
+    # Returns how long to back off if the error is a 429, otherwise None
+    if _status_code(error) != 429:
+        return None
+    response = getattr(error, "response", None)
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    delay = parse_retry_after(headers.get("Retry-After") or headers.get("retry-after"))
+    return delay if delay is not None else min(Config.RATE_LIMIT_MAX_BACKOFF, 2 ** attempt)
+
+def transient_error(error: Exception) -> bool:
+    # 5xx responses, and connects that never reached the provider. Matched by name because the
+    # SDKs wrap the transport error and may ship their own httpx build.
+    cause = error
+    while cause is not None:
+        if type(cause).__name__ == "ConnectError":
+            return True
+        cause = cause.__cause__
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+def _retry_decision(provider: str, error: Exception, throttled: int, server_errors: int):
+    # The SDK clients are built without retries, so 429s and transient errors all come through here.
+    # Returns ("throttled", pause) or ("transient", sleep) to retry, or None to give up.
+    delay = rate_limit_delay(error, throttled)
+    provider_requests_total.inc(provider=provider, status="429" if delay is not None else "error")
+    if delay is not None:
+        if throttled >= Config.RATE_LIMIT_MAX_RETRIES:
+            return None
+        return "throttled", max(MIN_THROTTLE_PAUSE, delay)
+    if transient_error(error) and server_errors < Config.HTTP_RETRIES:
+        return "transient", min(Config.RATE_LIMIT_MAX_BACKOFF, Config.HTTP_RETRY_BACKOFF * 2 ** server_errors)
+    return None
+
+def call_with_limits(provider: str, fn, *args, **kwargs):
+    limiter = limiters[provider]
+    throttled = server_errors = 0
+    while True:
+        with limiter.slot():
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+                provider_requests_total.inc(provider=provider, status="ok")
+                return result
+            except Exception as e:
+                retry = _retry_decision(provider, e, throttled, server_errors)
+                if retry is None:
+                    raise
+            finally:
+                provider_request_seconds.observe(time.monotonic() - started, provider=provider)
+        # Back off outside the slot: a 429 pauses the whole provider, a 5xx only this call
+        kind, delay = retry
+        if kind == "throttled":
+            limiter.pause(delay)
+            throttled += 1
+        else:
+            time.sleep(delay)
+            server_errors += 1
+
+async def call_with_limits_async(provider: str, fn, *args, **kwargs):
+    limiter = limiters[provider]
+    throttled = server_errors = 0
+    while True:
+        async with limiter.async_slot():
+            started = time.monotonic()
+            try:
+                result = await fn(*args, **kwargs)
+                provider_requests_total.inc(provider=provider, status="ok")
+                return result
+            except Exception as e:
+                retry = _retry_decision(provider, e, throttled, server_errors)
+                if retry is None:
+                    raise
+            finally:
+                provider_request_seconds.observe(time.monotonic() - started, provider=provider)
+        kind, delay = retry
+        if kind == "throttled":
+            limiter.pause(delay)
+            throttled += 1
+        else:
+            await asyncio.sleep(delay)
+            server_errors += 1
+
+limiters = {
+    "openai": ProviderLimiter("openai", Config.OPENAI_RATE_PER_SECOND, Config.OPENAI_BURST, Config.OPENAI_MAX_CONCURRENCY),
+    "luma": ProviderLimiter("luma", Config.LUMA_RATE_PER_SECOND, Config.LUMA_BURST, Config.LUMA_MAX_CONCURRENCY),
+    "luma_generations": ProviderLimiter("luma_generations", 0, 1, Config.LUMA_MAX_CONCURRENT_GENERATIONS),
+    "elevenlabs": ProviderLimiter("elevenlabs", Config.ELEVENLABS_RATE_PER_SECOND, Config.ELEVENLABS_BURST, Config.ELEVENLABS_MAX_CONCURRENCY),
+    "imgbb": ProviderLimiter("imgbb", Config.IMGBB_RATE_PER_SECOND, Config.IMGBB_BURST, Config.IMGBB_MAX_CONCURRENCY),
+}
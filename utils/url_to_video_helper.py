@@ -1,14 +1,8 @@
-import requests
-import time
-from config import Config
+from utils.luma_client import create_generation, wait_for_video
+from utils.luma_polling import generation_profile
 from models.pydantic_models import VideoGenerationResponse
 
 def generate_video_from_url(url: str, prompt: str) -> VideoGenerationResponse:
-    headers = {
-        "Authorization": f"Bearer {Config.LUMMA_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     payload = {
         "prompt": prompt,
         "keyframes": {
@@ -19,26 +13,7 @@ def generate_video_from_url(url: str, prompt: str) -> VideoGenerationResponse:
         }
     }
 
-    response = requests.post("https://api.lumalabs.ai/dream-machine/v1/generations", headers=headers, json=payload)
-    response.raise_for_status()
-    generation_id = response.json()["id"]
-
-    video_url = None
-    max_attempts = 60
-    for attempt in range(max_attempts):
-        status_response = requests.get(f"https://api.lumalabs.ai/dream-machine/v1/generations/{generation_id}", headers=headers)
-        status_response.raise_for_status()
-        status_data = status_response.json()
-
-        if status_data["state"] == "completed":
-            video_url = status_data["assets"]["video"]
-            break
-        elif status_data["state"] == "failed":
-            raise Exception(f"Video generation failed: {status_data.get('failure_reason', 'Unknown reason')}")
-        
-        time.sleep(5)
-
-    if not video_url:
-        raise Exception("Video generation timed out")
+    generation_id = create_generation(payload)
+    video_url = wait_for_video(generation_id, generation_profile(payload), just_created=True)
 
-    return VideoGenerationResponse(video_url=video_url)
+    return VideoGenerationResponse(video_url=video_url, generation_id=generation_id)
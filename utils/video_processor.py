@@ -1,60 +1,246 @@
 import os
 import tempfile
-import subprocess
 import logging
 import uuid
-import shutil
 from typing import Optional
 from models.pydantic_models import VideoGenerationResponse, SoundEffectResponse, FinalVideoResponse
+from utils.media_store import media_store
+from utils.mux_engine import mux_engine
+from config import Config
 
-def combine_video_and_audio(video: VideoGenerationResponse, audio: SoundEffectResponse) -> FinalVideoResponse:
+def build_mux_command(video: VideoGenerationResponse, audio: SoundEffectResponse, output_path: str, local_video_path: Optional[str] = None) -> list:
+    # Combine video and audio using ffmpeg, reading the prefetched copy when there is one
+    video_input = ['-i', local_video_path] if local_video_path else ['-rw_timeout', str(int(Config.MUX_INPUT_TIMEOUT_SECONDS * 1000000)), '-i', video.video_url]
+    return [
+        'ffmpeg',
+        '-nostdin',
+        *video_input,
+        '-i', audio.audio_url,
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-shortest',
+        # Put the moov atom first so playback can start before the download finishes
+        '-movflags', '+faststart',
+        output_path
+    ]
+
+def build_concat_command(list_path: str, audio: Optional[SoundEffectResponse], output_path: str) -> list:
+    # The concat demuxer joins the segments with stream copy, so the video is never re-encoded
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-f', 'concat',
+        '-safe', '0',
+        # Segments whose prefetch failed are read from Luma directly
+        '-protocol_whitelist', 'file,http,https,tcp,tls,crypto',
+        '-i', list_path,
+    ]
+    if audio is None:
+        return command + ['-c', 'copy', '-movflags', '+faststart', output_path]
+    return command + [
+        # One sound clip is shorter than the whole piece, so it loops under it
+        '-stream_loop', '-1',
+        '-i', audio.audio_url,
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-shortest',
+        '-movflags', '+faststart',
+        output_path
+    ]
+
+def write_concat_list(segment_paths: list, list_path: str):
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+def store_outputs(output_path: str, output_filename: str, audio: Optional[SoundEffectResponse], job_id: Optional[str] = None) -> FinalVideoResponse:
+    # Hand the output and the audio track over to the media store
+    media_store.add(output_path, output_filename, 'video', job_id=job_id)
+    if audio is None:
+        audio_id = None
+    else:
+        audio_id = media_store.add(audio.audio_url, media_store.new_id('audio', '.mp3'), 'audio', job_id=job_id)
+
+    # Convert the stored media ids to URLs
+    combined_video_url = f"/download_combined/{output_filename}"
+    audio_url = f"/download_audio/{audio_id}" if audio_id else None
+
+    logging.info(f"Combined video created at: {combined_video_url}")
+    return FinalVideoResponse(video_url=combined_video_url, audio_url=audio_url, media_id=output_filename)
+
+def store_video(local_video_path: str, job_id: Optional[str] = None) -> FinalVideoResponse:
+    # Keep a downloaded Luma video as the output when there is no audio to mix in
+    output_filename = media_store.new_id('output', '.mp4')
+    media_store.add(local_video_path, output_filename, 'video', job_id=job_id)
+    return FinalVideoResponse(video_url=f"/download_combined/{output_filename}", audio_url=None, media_id=output_filename)
+
+def remove_inputs(audio: SoundEffectResponse, local_video_path: Optional[str] = None):
+    # Clean up the temporary audio and video files
+    if audio.audio_url and os.path.exists(audio.audio_url):
+        os.remove(audio.audio_url)
+        logging.info(f"Temporary audio file removed: {audio.audio_url}")
+    if local_video_path and os.path.exists(local_video_path):
+        os.remove(local_video_path)
+
+def combine_video_and_audio(video: VideoGenerationResponse, audio: SoundEffectResponse, job_id: Optional[str] = None, local_video_path: Optional[str] = None) -> FinalVideoResponse:
     if audio.audio_url is None:
         logging.warning("No audio URL provided. Returning original video without audio.")
         return FinalVideoResponse(video_url=video.video_url, audio_url=None)
 
     try:
-        # Create a temporary directory to store the output
-        with tempfile.TemporaryDirectory() as temp_dir:
-            output_filename = f'output_{uuid.uuid4()}.mp4'
+        # Create a temporary directory next to the media store so the final move is a rename
+        with tempfile.TemporaryDirectory(dir=Config.MEDIA_ROOT) as temp_dir:
+            output_filename = media_store.new_id('output', '.mp4')
             temp_output_path = os.path.join(temp_dir, output_filename)
-            
-            # Combine video and audio using ffmpeg
-            command = [
-                'ffmpeg',
-                '-i', video.video_url,
-                '-i', audio.audio_url,
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-map', '0:v:0',
-                '-map', '1:a:0',
-                '-shortest',
-                temp_output_path
-            ]
-            
-            logging.info(f"Executing ffmpeg command: {' '.join(command)}")
-            result = subprocess.run(command, capture_output=True, text=True)
-            
+
+            result = mux_engine.run(build_mux_command(video, audio, temp_output_path, local_video_path))
+
             if result.returncode != 0:
                 logging.error(f"ffmpeg command failed. Error: {result.stderr}")
                 return FinalVideoResponse(video_url=video.video_url, audio_url=audio.audio_url)
-            
+
             logging.info("ffmpeg command executed successfully")
-            
-            # Move the output file to a permanent location
-            final_output_path = os.path.join(os.getcwd(), output_filename)
-            shutil.move(temp_output_path, final_output_path)
-            
-            # Convert the local file paths to URLs
-            combined_video_url = f"/download_combined/{output_filename}"
-            audio_url = f"/download_audio/{os.path.basename(audio.audio_url)}"
-            
-            logging.info(f"Combined video created at: {combined_video_url}")
-            return FinalVideoResponse(video_url=combined_video_url, audio_url=audio_url)
+            return store_outputs(temp_output_path, output_filename, audio, job_id)
     except Exception as e:
         logging.error(f"Error in combine_video_and_audio: {str(e)}")
         return FinalVideoResponse(video_url=video.video_url, audio_url=audio.audio_url)
     finally:
-        # Clean up the temporary audio file
-        if audio.audio_url and os.path.exists(audio.audio_url):
-            os.remove(audio.audio_url)
-            logging.info(f"Temporary audio file removed: {audio.audio_url}")
+        remove_inputs(audio, local_video_path)
+
+async def combine_video_and_audio_async(video: VideoGenerationResponse, audio: SoundEffectResponse, job_id: Optional[str] = None, local_video_path: Optional[str] = None) -> FinalVideoResponse:
+    if audio.audio_url is None:
+        logging.warning("No audio URL provided. Returning original video without audio.")
+        return FinalVideoResponse(video_url=video.video_url, audio_url=None)
+
+    try:
+        with tempfile.TemporaryDirectory(dir=Config.MEDIA_ROOT) as temp_dir:
+            output_filename = media_store.new_id('output', '.mp4')
+            temp_output_path = os.path.join(temp_dir, output_filename)
+
+            result = await mux_engine.run_async(build_mux_command(video, audio, temp_output_path, local_video_path))
+
+            if result.returncode != 0:
+                logging.error(f"ffmpeg command failed. Error: {result.stderr}")
+                return FinalVideoResponse(video_url=video.video_url, audio_url=audio.audio_url)
+
+            logging.info("ffmpeg command executed successfully")
+            return store_outputs(temp_output_path, output_filename, audio, job_id)
+    except Exception as e:
+        logging.error(f"Error in combine_video_and_audio_async: {str(e)}")
+        return FinalVideoResponse(video_url=video.video_url, audio_url=audio.audio_url)
+    finally:
+        remove_inputs(audio, local_video_path)
+
+def concatenate_segments(segment_paths: list, audio: Optional[SoundEffectResponse], job_id: Optional[str] = None) -> FinalVideoResponse:
+    # Segment paths are prefetched local files or, failing that, their Luma URLs
+    try:
+        with tempfile.TemporaryDirectory(dir=Config.MEDIA_ROOT) as temp_dir:
+            list_path = os.path.join(temp_dir, 'segments.txt')
+            write_concat_list(segment_paths, list_path)
+            output_filename = media_store.new_id('output', '.mp4')
+            temp_output_path = os.path.join(temp_dir, output_filename)
+
+            result = mux_engine.run(build_concat_command(list_path, audio, temp_output_path))
+
+            if result.returncode != 0:
+                logging.error(f"ffmpeg command failed. Error: {result.stderr}")
+                raise Exception("Failed to join the video segments")
+
+            logging.info(f"Joined {len(segment_paths)} video segments")
+            return store_outputs(temp_output_path, output_filename, audio, job_id)
+    finally:
+        if audio is not None:
+            remove_inputs(audio)
+        for path in segment_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def rendition_ids() -> dict:
+    # The playlist and its media file share a random part, so they land in the same directory
+    # and the playlist can reference the media file by name
+    stem = uuid.uuid4().hex
+    return {
+        "hls_playlist": f"hls_{stem}.m3u8",
+        "hls_media": f"hls_{stem}.mp4",
+        "poster": f"poster_{stem}.jpg",
+        "preview": f"preview_{stem}.mp4",
+    }
+
+def build_package_command(video_path: str, temp_dir: str, ids: dict) -> list:
+    # One ffmpeg run reads the output once and writes every rendition
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-i', video_path,
+        # HLS by stream copy: one fragmented MP4 that the playlist addresses by byte range
+        '-map', '0:v:0', '-map', '0:a?',
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(Config.HLS_SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_flags', 'single_file',
+        '-hls_segment_filename', os.path.join(temp_dir, ids["hls_media"]),
+        os.path.join(temp_dir, ids["hls_playlist"]),
+        # Poster from the first frame
+        '-map', '0:v:0',
+        '-frames:v', '1',
+        '-q:v', '3',
+        os.path.join(temp_dir, ids["poster"]),
+        # Low-resolution preview with its shorter side at PREVIEW_HEIGHT
+        '-map', '0:v:0', '-map', '0:a?',
+        '-vf', f"scale='if(gt(iw,ih),-2,{Config.PREVIEW_HEIGHT})':'if(gt(iw,ih),{Config.PREVIEW_HEIGHT},-2)'",
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-crf', '30',
+        '-c:a', 'copy',
+        '-movflags', '+faststart',
+        os.path.join(temp_dir, ids["preview"]),
+    ]
+
+def store_renditions(temp_dir: str, ids: dict, job_id: Optional[str] = None) -> dict:
+    for kind, media_id in ids.items():
+        media_store.add(os.path.join(temp_dir, media_id), media_id, kind, job_id=job_id)
+    return {
+        "hls_url": f"/media/{ids['hls_playlist']}",
+        "poster_url": f"/media/{ids['poster']}",
+        "preview_url": f"/media/{ids['preview']}",
+    }
+
+def package_video(media_id: str, job_id: Optional[str] = None) -> dict:
+    # Playback renditions are optional; without them the player falls back to the MP4
+    video_path = media_store.resolve(media_id)
+    if not video_path:
+        return {}
+    try:
+        with tempfile.TemporaryDirectory(dir=Config.MEDIA_ROOT) as temp_dir:
+            ids = rendition_ids()
+            result = mux_engine.run(build_package_command(video_path, temp_dir, ids))
+            if result.returncode != 0:
+                logging.error(f"ffmpeg packaging failed. Error: {result.stderr}")
+                return {}
+            return store_renditions(temp_dir, ids, job_id)
+    except Exception as e:
+        logging.error(f"Error in package_video: {str(e)}")
+        return {}
+
+async def package_video_async(media_id: str, job_id: Optional[str] = None) -> dict:
+    video_path = media_store.resolve(media_id)
+    if not video_path:
+        return {}
+    try:
+        with tempfile.TemporaryDirectory(dir=Config.MEDIA_ROOT) as temp_dir:
+            ids = rendition_ids()
+            result = await mux_engine.run_async(build_package_command(video_path, temp_dir, ids))
+            if result.returncode != 0:
+                logging.error(f"ffmpeg packaging failed. Error: {result.stderr}")
+                return {}
+            return store_renditions(temp_dir, ids, job_id)
+    except Exception as e:
+        logging.error(f"Error in package_video_async: {str(e)}")
+        return {}